@@ -0,0 +1,184 @@
+# app/admission.py
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Iterator
+
+import numpy as np
+from starlette.concurrency import iterate_in_threadpool
+
+from app.config import PIPELINE_EXECUTOR, PIPELINE_QUEUE_SIZE, PIPELINE_WORKERS
+
+
+class AdmissionRejected(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Search capacity exhausted, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Runs blocking pipeline calls on a worker pool so the event loop stays responsive.
+
+    At most `max_in_flight` calls run at once (one per worker); up to `max_queued` more wait for a
+    worker in arrival order, and any call beyond that is rejected with `AdmissionRejected`, whose
+    `retry_after` estimates when a worker frees up from recent run times. Queue waits and run times
+    of the last `window` calls are kept for `stats`.
+    """
+
+    def __init__(self, executor_kind: str, max_in_flight: int, max_queued: int, window: int = 1000):
+        if executor_kind not in ("thread", "process"):
+            raise ValueError(f"Unknown pipeline executor: {executor_kind}")
+        self.executor_kind = executor_kind
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._waits = deque(maxlen=window)
+        self._run_times = deque(maxlen=window)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.failed = 0
+
+    @property
+    def executor(self):
+        # Created on first use, so importing the app does not start (or fork) workers
+        with self._executor_lock:
+            if self._executor is None:
+                if self.executor_kind == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_in_flight)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="pipeline")
+            return self._executor
+
+    def check_capacity(self):
+        """Raise `AdmissionRejected` if every worker is busy and the wait queue is full."""
+        if self._slots.locked() and self.queued >= self.max_queued:
+            self.rejected += 1
+            logging.warning(f"Rejecting search: {self.in_flight} running and {self.queued} queued")
+            raise AdmissionRejected(self.retry_after())
+
+    async def acquire(self) -> float:
+        """
+        Wait for a free worker slot, or raise `AdmissionRejected` if the queue is full. Returns the
+        admission time, to be passed to `release` when the work is done.
+        """
+        self.check_capacity()
+        return await self._wait_for_slot()
+
+    async def _wait_for_slot(self) -> float:
+        self.queued += 1
+        enqueued = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        started = time.perf_counter()
+        self._waits.append(started - enqueued)
+        self.admitted += 1
+        self.in_flight += 1
+        return started
+
+    def release(self, started: float):
+        self._run_times.append(time.perf_counter() - started)
+        self.in_flight -= 1
+        self._slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` on the pool once a worker is free and return its result.
+        """
+        started = await self.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+        except BaseException:
+            self.release(started)
+            raise
+        # The worker slot is held until the call finishes, even if the request is cancelled meanwhile
+        future.add_done_callback(lambda _: self.release(started))
+        try:
+            return await future
+        except Exception:
+            self.failed += 1
+            raise
+
+    async def stream(self, items: Iterator):
+        """
+        Admit a streaming call: raise `AdmissionRejected` now if the queue is full, otherwise return
+        an async iterator that waits for a slot when first advanced, advances `items` on a thread and
+        holds the slot until it is exhausted or closed. The slot is only taken once the response body
+        is being sent, so a client that disconnects before then never holds one. Streams run on
+        threads whatever the executor, since generators cannot be iterated across processes.
+        """
+        self.check_capacity()
+
+        async def admitted():
+            started = await self._wait_for_slot()
+            try:
+                async for item in iterate_in_threadpool(items):
+                    yield item
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.release(started)
+
+        return admitted()
+
+    def retry_after(self) -> int:
+        """Seconds until the queue has likely drained enough to admit one more call."""
+        run_time = float(np.mean(self._run_times)) if self._run_times else 1.0
+        return max(1, math.ceil(run_time * (self.queued + 1) / self.max_in_flight))
+
+    def stats(self) -> dict:
+        waits = np.fromiter(self._waits, dtype=float)
+        run_times = np.fromiter(self._run_times, dtype=float)
+
+        def summary(values):
+            if not len(values):
+                return {"mean": 0.0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+            return {
+                "mean": round(float(values.mean()), 4),
+                "p50": round(float(np.percentile(values, 50)), 4),
+                "p99": round(float(np.percentile(values, 99)), 4),
+                "max": round(float(values.max()), 4),
+            }
+
+        return {
+            "executor": self.executor_kind,
+            "workers": self.max_in_flight,
+            "max_queue": self.max_queued,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "queue_wait_seconds": summary(waits),
+            "run_seconds": summary(run_times),
+        }
+
+
+_admission = AdmissionController(PIPELINE_EXECUTOR, PIPELINE_WORKERS, PIPELINE_QUEUE_SIZE)
+
+
+async def run_admitted(fn, *args, **kwargs):
+    return await _admission.run(fn, *args, **kwargs)
+
+
+async def stream_admitted(items: Iterator):
+    return await _admission.stream(items)
+
+
+def admission_stats() -> dict:
+    return _admission.stats()
@@ -3,6 +3,8 @@ from fuzzywuzzy import fuzz
 import pandas as pd
 import numpy as np
 import logging
+from app.name_scoring import ratio_scores
+from app.score_memo import score_distinct
 
 def calculate_age(dob):
     """Calculate age from pandas Timestamp."""
@@ -63,6 +65,69 @@ def dob_string_similarity(dob1, dob2):
     str_similarity = fuzz.ratio(dob1_str, dob2_str)
     return pd.Series([str_similarity, dob1_str, dob2_str, 0, 0, 0, 0])
 
+def calculate_ages(dobs, today=None):
+    """Column-wise version of `calculate_age`; returns float ages with NaN for missing or invalid DOBs."""
+    dobs = pd.to_datetime(pd.Series(dobs), errors="coerce")
+    today = pd.Timestamp.today() if today is None else today
+    before_birthday = (dobs.dt.month > today.month) | ((dobs.dt.month == today.month) & (dobs.dt.day > today.day))
+    ages = today.year - dobs.dt.year - before_birthday.astype(int)
+    return ages.clip(lower=0).astype(float)
+
+def age_similarity_scores(query_dob, dobs):
+    """Column-wise version of `age_similarity_score`; each distinct DOB is scored once."""
+    dobs = pd.Series(dobs)
+    if pd.isnull(query_dob):
+        return pd.Series(0.0, index=dobs.index)
+
+    query_age = calculate_age(query_dob)
+    if np.isnan(query_age) or query_age == 0:
+        return pd.Series(0.0, index=dobs.index)
+
+    def score(unique_dobs):
+        actual_age = calculate_ages(unique_dobs).to_numpy()
+        invalid = np.isnan(actual_age) | (actual_age == 0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_age_diff = np.log(np.maximum(actual_age, query_age) / np.minimum(actual_age, query_age))
+        scores = np.maximum(0, 100 - (log_age_diff * 100))
+        scores = np.where(actual_age == query_age, 100.0, scores)
+        return np.where(invalid, 0.0, scores)
+
+    return pd.Series(score_distinct(dobs, score, missing=0.0).astype(float), index=dobs.index)
+
+def dob_string_similarity_columns(dob1, dobs, parsed=None):
+    """
+    Column-wise version of `dob_string_similarity`.
+    `parsed` optionally gives `dobs` already converted to datetime64 (NaT where invalid).
+    Returns: DataFrame with [similarity, str_dob1, str_dob2, rarity1, rarity2, prob1, prob2] columns
+    """
+    dobs = pd.Series(dobs)
+    parsed = pd.to_datetime(dobs, errors="coerce") if parsed is None else pd.Series(parsed, index=dobs.index)
+    valid = parsed.notna()
+
+    try:
+        dob1_str = None if pd.isnull(dob1) else pd.to_datetime(dob1).strftime('%Y-%m-%d')
+    except Exception:
+        dob1_str = None
+    if dob1_str is None:
+        valid[:] = False
+
+    dob2_str = parsed.dt.strftime('%Y-%m-%d')
+    similarity = pd.Series(np.nan, index=dobs.index)
+    if valid.any():
+        similarity[valid] = ratio_scores(dob1_str, dob2_str[valid], lowercase=False)
+
+    zeros = pd.Series(np.where(valid, 0, np.nan), index=dobs.index)
+    return pd.DataFrame({
+        0: similarity,
+        1: pd.Series(dob1_str if dob1_str is not None else dob1, index=dobs.index, dtype=object).where(valid, dob1),
+        2: dob2_str.astype(object).where(valid, dobs),
+        3: zeros,
+        4: zeros,
+        5: zeros,
+        6: zeros,
+    }, index=dobs.index)
+
 # Example Usage
 # dob_example = datetime(2000, 1, 1)  # Example DOB
 # query_age =  12 # Example query age
@@ -0,0 +1,56 @@
+# app/candidate_merge.py
+import heapq
+
+import pandas as pd
+
+
+class CandidateHeap:
+    """
+    Bounded heap of the best candidates across shards, keyed by FAISS distance.
+
+    Shard result frames are pushed as shards complete; only the `capacity` closest candidates are
+    retained (ties broken by shard position, then FAISS rank, so the result is deterministic), and
+    rows that fall out of the heap are dropped straight away. Memory therefore depends on the
+    capacity, not on shards x k.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._heap = []  # (-distance, -shard_position, -row): the worst retained candidate is on top
+        self._frames = {}
+        self.pushed = 0
+
+    def push(self, shard_position: int, matches: pd.DataFrame):
+        matches = matches.reset_index(drop=True)
+        self.pushed += len(matches)
+        for row, distance in enumerate(matches["faiss_distance"].to_numpy()):
+            entry = (-float(distance), -shard_position, -row)
+            if len(self._heap) < self.capacity:
+                heapq.heappush(self._heap, entry)
+            elif entry > self._heap[0]:
+                heapq.heapreplace(self._heap, entry)
+        self._frames[shard_position] = matches
+        self._prune()
+
+    def _prune(self):
+        retained = {}
+        for _, neg_shard, neg_row in self._heap:
+            retained.setdefault(-neg_shard, []).append(-neg_row)
+        self._frames = {
+            shard_position: frame.loc[sorted(retained[shard_position])]
+            for shard_position, frame in self._frames.items()
+            if shard_position in retained
+        }
+
+    def __len__(self):
+        return len(self._heap)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Retained candidates, closest first.
+        """
+        if not self._frames:
+            return pd.DataFrame(columns=["faiss_distance"])
+        merged = pd.concat(self._frames)
+        order = sorted((-neg_distance, -neg_shard, -neg_row) for neg_distance, neg_shard, neg_row in self._heap)
+        return merged.loc[[(shard_position, row) for _, shard_position, row in order]].reset_index(drop=True)
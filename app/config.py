@@ -9,6 +9,80 @@ result_backend= os.getenv('result_backend')
 PREPROCESSOR_DIR = "model"
 XML_FOLDER = "data/raw_xml"
 
+# Upper bound on shards searched concurrently per request
+SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", 4))
+
+# Largest number of query profiles accepted by /batch_combined_operation
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", 5000))
+
+# Shard bundle cache: byte budget and eviction policy ("lru" or "lfu")
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", 4 * 1024**3))
+MODEL_CACHE_POLICY = os.getenv("MODEL_CACHE_POLICY", "lru")
+
+# Warm the shards just before and after each query's date range in the background
+SHARD_PREFETCH = os.getenv("SHARD_PREFETCH", "true").lower() in ("1", "true", "yes")
+
 CATEGORICAL_FEATURES = ["gender", "nationality"]
 NUMERIC_FEATURES = ["relative_age", "dep_lat", "dep_lon", "arr_lat", "arr_lon"]
 TEXT_FEATURES = ["surname", "address", "city", "firstname"]
+
+# Shard metadata columns gathered for FAISS hits (everything scoring and the response need)
+RESULT_METADATA_COLUMNS = [
+    "booking_ref", "travel_doc", "firstname", "surname", "dob", "gender", "nationality",
+    "address", "city", "country", "departure_time", "arrival_time", "departure_airport",
+    "arrival_airport", "flight_number", "carrier", "dep_lat", "dep_lon", "arr_lat", "arr_lon",
+    # Derived at bundle build time (shard_bundle.derive_metadata_columns), gathered when present
+    "OriginCity", "DestinationCity", "OriginCountry", "DestinationCountry",
+    "firstname_norm", "surname_norm", "dob_day",
+]
+
+# FAISS neighbours per shard, and the caps for adaptive candidate expansion (min_results)
+DEFAULT_TOP_K = 25
+MAX_TOP_K = int(os.getenv("MAX_TOP_K", 1000))
+MAX_NPROBE = int(os.getenv("MAX_NPROBE", 256))
+MAX_EXPANSION_ROUNDS = int(os.getenv("MAX_EXPANSION_ROUNDS", 4))
+
+# Closest candidates across all shards (by FAISS distance) kept by the streaming merge and scored
+MAX_CANDIDATES = int(os.getenv("MAX_CANDIDATES", 500))
+
+# Shared cross-shard embedding: one preprocessing bundle, fitted at training time on a sample
+# stratified by month, is saved under SHARED_EMBEDDING_LABEL and reused by every shard
+SHARED_EMBEDDING = os.getenv("SHARED_EMBEDDING", "false").lower() in ("1", "true", "yes")
+SHARED_EMBEDDING_LABEL = "global"
+SHARED_EMBEDDING_SAMPLE = int(os.getenv("SHARED_EMBEDDING_SAMPLE", 200000))
+
+# Embed queries with the precompiled NumPy embedder (app/query_embedder.py) instead of the sklearn transforms
+COMPILED_EMBEDDER = os.getenv("COMPILED_EMBEDDER", "true").lower() in ("1", "true", "yes")
+
+# Re-hash every file of a consolidated shard bundle against its manifest on load (sizes are always checked)
+SHARD_BUNDLE_VERIFY = os.getenv("SHARD_BUNDLE_VERIFY", "false").lower() in ("1", "true", "yes")
+
+# Per-process memo of (query value, candidate value) feature scores, in entries
+SCORE_MEMO_SIZE = int(os.getenv("SCORE_MEMO_SIZE", 200000))
+
+# Cache of scored search candidates (before the name/age thresholds), keyed on the normalized search
+# inputs and the shards' build versions, so reruns with other thresholds skip the search. Entries live
+# RESULT_CACHE_TTL seconds (0 disables the cache) in Redis at RESULT_CACHE_URL, or in an in-process LRU
+# of RESULT_CACHE_SIZE entries when no URL is set or Redis is unreachable
+RESULT_CACHE_URL = os.getenv("RESULT_CACHE_URL", "")
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 900))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 256))
+
+# Search requests run off the event loop on a "thread" or "process" pool of PIPELINE_WORKERS;
+# at most PIPELINE_QUEUE_SIZE more wait for a worker, beyond that requests get 429 with Retry-After
+PIPELINE_EXECUTOR = os.getenv("PIPELINE_EXECUTOR", "thread")
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", 4))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 32))
+
+# Shard-affinity routing of Celery per-shard subtasks: with SHARD_AFFINITY, the subtask for a shard
+# listed in AFFINITY_SHARDS (comma-separated labels, the shards some worker owns) goes to the queue
+# SHARD_QUEUE_PREFIX + label, consumed only by the workers that list the shard in WORKER_SHARDS;
+# those workers also preload their shards at boot. Other shards' subtasks stay on the default queue
+SHARD_AFFINITY = os.getenv("SHARD_AFFINITY", "false").lower() in ("1", "true", "yes")
+SHARD_QUEUE_PREFIX = os.getenv("SHARD_QUEUE_PREFIX", "shard.")
+WORKER_SHARDS = [label.strip() for label in os.getenv("WORKER_SHARDS", "").split(",") if label.strip()]
+AFFINITY_SHARDS = [label.strip() for label in os.getenv("AFFINITY_SHARDS", "").split(",") if label.strip()]
+
+# Request fields that can be enforced as exact filters inside the FAISS search -> metadata column
+STRUCTURED_FILTERS = {"sex": "gender", "nationality": "nationality"}
+STRUCTURED_FILTER_COLUMNS = list(STRUCTURED_FILTERS.values())
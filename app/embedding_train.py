@@ -5,7 +5,12 @@ from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.decomposition import TruncatedSVD
 from scipy import sparse as sp
+import os
+import joblib
 from config import NUMERIC_FEATURES, CATEGORICAL_FEATURES, TEXT_FEATURES
+from query_embedder import compile_query_embedder
+
+PREPROCESSOR_NAMES = ["encoder", "scaler", "tfidf_name", "tfidf_addr", "svd_name", "svd_addr"]
 
     # --- FastBM25 Vectorization ---
 def safe_tokenize(text):
@@ -38,9 +43,9 @@ def embed_passengers_train(df, encoder=None, scaler=None, tfidf_name=None, tfidf
     if fit:
         scaler = StandardScaler()
         numeric_data = scaler.fit_transform(df_numeric)
-        numeric_data *= 0.1
     else:
         numeric_data = scaler.transform(df_numeric)
+    numeric_data *= 0.1
 
     # === Categorical Features ===
     df_cat = df[CATEGORICAL_FEATURES].fillna("unknown")
@@ -67,27 +72,33 @@ def embed_passengers_train(df, encoder=None, scaler=None, tfidf_name=None, tfidf
 
     # === TF-IDF + SVD on Full Name ===
 
-    tfidf_name = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 5), max_features=700)
-    svd_name = TruncatedSVD(n_components=150, random_state=42)
+    if fit:
+        tfidf_name = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 5), max_features=700)
+        svd_name = TruncatedSVD(n_components=150, random_state=42)
 
-    if full_name.str.strip().str.len().sum() == 0:
-        raise ValueError("❌ All 'full_name' entries are empty after normalization.")
+        if full_name.str.strip().str.len().sum() == 0:
+            raise ValueError("❌ All 'full_name' entries are empty after normalization.")
 
-    X_name = tfidf_name.fit_transform(full_name)
-    X_name_reduced = svd_name.fit_transform(X_name)
+        X_name = tfidf_name.fit_transform(full_name)
+        X_name_reduced = svd_name.fit_transform(X_name)
+    else:
+        X_name_reduced = svd_name.transform(tfidf_name.transform(full_name))
 
 
 
     # === TF-IDF + SVD on Address ===
 
-    tfidf_addr = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 5), max_features=700)
-    svd_addr = TruncatedSVD(n_components=75, random_state=42)
+    if fit:
+        tfidf_addr = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 5), max_features=700)
+        svd_addr = TruncatedSVD(n_components=75, random_state=42)
 
-    if address_block.str.strip().str.len().sum() == 0:
-        raise ValueError("❌ All 'address_block' entries are empty after normalization.")
+        if address_block.str.strip().str.len().sum() == 0:
+            raise ValueError("❌ All 'address_block' entries are empty after normalization.")
 
-    X_addr = tfidf_addr.fit_transform(address_block)
-    X_addr_reduced = svd_addr.fit_transform(X_addr)
+        X_addr = tfidf_addr.fit_transform(address_block)
+        X_addr_reduced = svd_addr.fit_transform(X_addr)
+    else:
+        X_addr_reduced = svd_addr.transform(tfidf_addr.transform(address_block))
 
 
     # === Weighted Concatenation ===
@@ -112,4 +123,54 @@ def embed_passengers_train(df, encoder=None, scaler=None, tfidf_name=None, tfidf
     print("Train address reduced:", X_addr_reduced.shape[1])
     print("Train final embedding:", embeddings.shape[1])
 
-    return embeddings, encoder, scaler, tfidf_name, tfidf_addr, svd_name, svd_addr
\ No newline at end of file
+    return embeddings, encoder, scaler, tfidf_name, tfidf_addr, svd_name, svd_addr
+
+
+# === Shared cross-shard embedding ===
+
+def stratified_sample(df, n_samples, date_column="departure_time", random_state=42):
+    """
+    Sample up to `n_samples` rows spread evenly over the calendar months of `date_column`.
+
+    Months with fewer rows than their share contribute all of them; the shortfall is not redistributed.
+    """
+    if len(df) <= n_samples:
+        return df
+    months = pd.to_datetime(df[date_column], errors="coerce").dt.to_period("M")
+    groups = df.groupby(months, dropna=False, group_keys=False)
+    per_month = max(1, n_samples // groups.ngroups)
+    return groups.apply(lambda g: g.sample(n=min(len(g), per_month), random_state=random_state))
+
+
+def fit_global_preprocessors(df, n_samples, random_state=42):
+    """
+    Fit one encoder/scaler/TF-IDF/SVD bundle on a month-stratified sample of all passengers,
+    so every shard embeds into the same space.
+    """
+    sample = stratified_sample(df, n_samples, random_state=random_state).copy()
+    print(f"Fitting shared preprocessors on {len(sample)} of {len(df)} passengers")
+    _, *fitted = embed_passengers_train(sample, fit=True)
+    return dict(zip(PREPROCESSOR_NAMES, fitted))
+
+
+def embed_shard(df, preprocessors=None):
+    """
+    Embed a shard's passengers with the shared `preprocessors`, or fit shard-specific ones when None.
+
+    Returns:
+        (embeddings, preprocessors): preprocessors is None when the shared bundle was used
+    """
+    if preprocessors is None:
+        embeddings, *fitted = embed_passengers_train(df, fit=True)
+        return embeddings, dict(zip(PREPROCESSOR_NAMES, fitted))
+    embeddings, *_ = embed_passengers_train(df, fit=False, **preprocessors)
+    return embeddings, None
+
+
+def save_preprocessors(preprocessors, out_dir, label):
+    """
+    Save the fitted preprocessors and the precompiled query embedder the API serves queries with.
+    """
+    for name in PREPROCESSOR_NAMES:
+        joblib.dump(preprocessors[name], os.path.join(out_dir, f"{name}_{label}.pkl"))
+    joblib.dump(compile_query_embedder(preprocessors), os.path.join(out_dir, f"embedder_{label}.pkl"))
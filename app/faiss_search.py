@@ -1,54 +1,130 @@
+import math
 import joblib
 import numpy as np
 import pandas as pd
 import faiss
+import pyarrow as pa
+from typing import List, Optional, Tuple, Union
 
+from app.shard_bundle import decode_dictionaries
 
-def faiss_search_with_metadata(
-    embedding: np.ndarray,
+
+def metadata_columns(metadata: Union[pd.DataFrame, pa.Table]) -> List[str]:
+    return metadata.column_names if isinstance(metadata, pa.Table) else list(metadata.columns)
+
+
+def _resolve_hits(
+    distances: np.ndarray,
+    positions: np.ndarray,
+    metadata: Union[pd.DataFrame, pa.Table],
+    columns: Optional[List[str]],
+    include_distance: bool,
+    include_confidence: bool
+) -> pd.DataFrame:
+    """
+    Resolve one query row of FAISS hits into ranked passenger metadata.
+
+    Hits are addressed by their row position in the index (which is aligned with `metadata`),
+    so resolution costs O(k) and every hit keeps its own rank and distance. A memory-mapped
+    Arrow table only materializes the k hit rows.
+    """
+    # FAISS pads with -1 when fewer than k neighbours are found
+    found = positions >= 0
+    positions = positions[found]
+    distances = distances[found]
+
+    if isinstance(metadata, pa.Table):
+        source = metadata if columns is None else metadata.select(columns)
+        matched = decode_dictionaries(source.take(positions)).to_pandas()
+        matched.index = positions
+    else:
+        source = metadata if columns is None else metadata[columns]
+        matched = source.take(positions).copy()
+
+    # Attach FAISS distance and confidence
+    if include_distance:
+        matched["faiss_distance"] = distances
+
+    if include_confidence:
+        matched["confidence_score"] = np.round(1 / (1 + distances), 6) if include_distance else np.nan
+
+    return matched
+
+
+def index_probes(index: faiss.Index) -> Optional[Tuple[int, int]]:
+    """
+    (default nprobe, nlist) of an IVF index, or None for non-IVF indexes.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    return None if ivf is None else (int(ivf.nprobe), int(ivf.nlist))
+
+
+def build_search_params(index: faiss.Index, row_mask: Optional[np.ndarray] = None, top_k: int = 25, nprobe: Optional[int] = None):
+    """
+    Build FAISS search parameters: an optional row restriction and, for IVF indexes, nprobe.
+
+    With a row mask, nprobe is widened with the filter's selectivity so that the probed lists are
+    expected to hold about `top_k` eligible rows (the selected rows are assumed spread over the lists).
+
+    Returns:
+        tuple: (SearchParameters or None, bitmap that must stay alive for the duration of the search)
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    restricted = row_mask is not None and not row_mask.all()
+    if not restricted:
+        if ivf is None or nprobe is None:
+            return None, None
+        return faiss.SearchParametersIVF(nprobe=min(ivf.nlist, nprobe)), None
+
+    bitmap = np.packbits(row_mask.astype(bool), bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(row_mask), faiss.swig_ptr(bitmap))
+    if ivf is None:
+        return faiss.SearchParameters(sel=selector), bitmap
+
+    selected = max(int(row_mask.sum()), 1)
+    base_nprobe = ivf.nprobe if nprobe is None else nprobe
+    nprobe = min(ivf.nlist, max(base_nprobe, math.ceil(top_k * ivf.nlist / selected)))
+    return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe), bitmap
+
+
+def faiss_search_batch_with_metadata(
+    embeddings: np.ndarray,
     index: faiss.Index,
-    db_ids: np.ndarray,
     metadata: pd.DataFrame,
     top_k: int = 25,
     include_distance: bool = True,
-    include_confidence: bool = True
-) -> pd.DataFrame:
+    include_confidence: bool = True,
+    columns: Optional[List[str]] = None,
+    row_mask: Optional[np.ndarray] = None,
+    nprobe: Optional[int] = None
+) -> List[pd.DataFrame]:
     """
-    Perform FAISS search and return passenger metadata with additional metrics.
+    Perform a single multi-row FAISS search and split the hits back out per query.
 
     Args:
-        embedding (np.ndarray): (1, dim) embedding of query
+        embeddings (np.ndarray): (n_queries, dim) embeddings of the queries
         index (faiss.Index): FAISS index
-        db_ids (np.ndarray): array of 'travel_doc' values aligned with index
-        metadata (pd.DataFrame): full metadata used to build the index
-        top_k (int): number of nearest neighbors
+        metadata (pd.DataFrame or pa.Table): full metadata used to build the index, row-aligned with it
+        top_k (int): number of nearest neighbors per query
         include_distance (bool): add 'faiss_distance'
         include_confidence (bool): add 'confidence_score'
+        columns (List[str]): metadata columns to gather (default: all)
+        row_mask (np.ndarray): boolean mask over index rows; only these rows are searched
+        nprobe (int): IVF lists to probe (default: the index setting)
 
     Returns:
-        pd.DataFrame: matched passengers + optional scores
+        List[pd.DataFrame]: matched passengers + optional scores, one frame per query row
     """
-    assert embedding.shape[1] == index.d, f"Embedding dim {embedding.shape[1]} does not match FAISS index dim {index.d}"
-    D, I = index.search(embedding, top_k)
-    top_ids = db_ids[I[0]]
-
-    # Build mapping for rank
-    id_rank = {doc_id: rank for rank, doc_id in enumerate(top_ids)}
-    matched = metadata[metadata["travel_doc"].isin(top_ids)].copy()
-    matched["rank"] = matched["travel_doc"].map(id_rank)
+    assert embeddings.shape[1] == index.d, f"Embedding dim {embeddings.shape[1]} does not match FAISS index dim {index.d}"
+    if row_mask is not None and not row_mask.any():
+        D = np.empty((embeddings.shape[0], 0), dtype=np.float32)
+        I = np.empty((embeddings.shape[0], 0), dtype=np.int64)
+    else:
+        params, bitmap = build_search_params(index, row_mask, top_k, nprobe)
+        D, I = index.search(embeddings, top_k, params=params)
 
-    # Attach FAISS distance and confidence
-    if include_distance:
-        matched["faiss_distance"] = matched["travel_doc"].map(
-            lambda doc: D[0][id_rank[doc]]
-        )
+    return [
+        _resolve_hits(D[row], I[row], metadata, columns, include_distance, include_confidence)
+        for row in range(embeddings.shape[0])
+    ]
 
-    if include_confidence:
-        matched["confidence_score"] = matched["faiss_distance"].map(
-            lambda d: round(1 / (1 + d), 6)
-        ) if "faiss_distance" in matched.columns else np.nan
-
-    matched.sort_values("rank", inplace=True)
-    matched.drop(columns=["rank"], inplace=True)
-
-    return matched
@@ -1,74 +1,105 @@
+import threading
+
+import numpy as np
 import pandas as pd
-from functools import lru_cache
 
 class LocDataAccess:
+    """
+    Airport geo lookups backed by a compact table built once at startup.
+
+    Each airport gets an integer id (its row in the crosswalk); coordinates are float64 arrays and
+    city/country are object arrays indexed by that id. IATA codes and lowercased city names map to
+    the id of their first row in the crosswalk.
+    """
     _instance = None
+    _lock = threading.Lock()
 
     @staticmethod
     def get_instance():
         if LocDataAccess._instance is None:
-            LocDataAccess()
+            with LocDataAccess._lock:
+                if LocDataAccess._instance is None:
+                    LocDataAccess()
         return LocDataAccess._instance
 
     def __init__(self):
         if LocDataAccess._instance is not None:
             raise Exception("This class is a singleton!")
         else:
-            self.df_airports = pd.read_csv('data/geoCrosswalk/GeoCrossWalkMed.csv')
-            self.df_airports.set_index('IATA', inplace=True)
+            df_airports = pd.read_csv('data/geoCrosswalk/GeoCrossWalkMed.csv')
+
+            self.lon = df_airports['Longitude'].to_numpy(dtype=np.float64)
+            self.lat = df_airports['Latitude'].to_numpy(dtype=np.float64)
+            self.city = df_airports['City'].to_numpy(dtype=object)
+            self.country = df_airports['HH_ISO'].to_numpy(dtype=object)
+
+            # First row wins for duplicated IATA codes and city names
+            iata = df_airports['IATA'].dropna().drop_duplicates()
+            self.iata_to_id = dict(zip(iata, iata.index))
+            self._iata_index = pd.Index(iata.to_numpy())
+            self._iata_ids = iata.index.to_numpy()
+
+            city = df_airports['City'].dropna().str.lower().drop_duplicates()
+            self.city_to_id = dict(zip(city, city.index))
+
             LocDataAccess._instance = self
 
-    @lru_cache(maxsize=None)
+    def _iata_id(self, iata_code):
+        try:
+            return self.iata_to_id.get(iata_code)
+        except TypeError:
+            return None
+
+    def _city_id(self, city_name):
+        if city_name is None:
+            return None
+        return self.city_to_id.get(city_name.lower())
+
     def get_airport_lon_lat_by_iata(self, iata_code):
-        if iata_code in self.df_airports.index:
-            airport_data = self.df_airports.loc[iata_code]
-
-            # If multiple rows (DataFrame), pick the first one
-            if isinstance(airport_data, pd.DataFrame):
-                airport_data = airport_data.iloc[0]
-
-            try:
-                lon = float(airport_data['Longitude'])
-                lat = float(airport_data['Latitude'])
-                return lon, lat
-            except (TypeError, ValueError):
-                return None, None
-        else:
+        airport_id = self._iata_id(iata_code)
+        if airport_id is None:
             return None, None
+        return float(self.lon[airport_id]), float(self.lat[airport_id])
 
-    @lru_cache(maxsize=None)
     def get_airport_lon_lat_by_city(self, city_name):
-        if city_name is None:
-            return None, None
-        
-        airport_data = self.df_airports[self.df_airports['City'].str.lower() == city_name.lower()]
-        if not airport_data.empty:
-            return airport_data.iloc[0]['Longitude'], airport_data.iloc[0]['Latitude']
-        else:
+        airport_id = self._city_id(city_name)
+        if airport_id is None:
             return None, None
+        return self.lon[airport_id], self.lat[airport_id]
 
-    @lru_cache(maxsize=None)
     def get_city_by_airport_iata(self, iata_code):
-        if iata_code in self.df_airports.index:
-            airport_data = self.df_airports.loc[iata_code]
-            return airport_data['City']
-        else:
-            return None
+        airport_id = self._iata_id(iata_code)
+        return None if airport_id is None else self.city[airport_id]
 
-    @lru_cache(maxsize=None)
     def get_country_by_airport_iata(self, iata_code):
-        if iata_code in self.df_airports.index:
-            airport_data = self.df_airports.loc[iata_code]
-            return airport_data['HH_ISO']
-        else:
-            return None
-    
-    @lru_cache(maxsize=None)
+        airport_id = self._iata_id(iata_code)
+        return None if airport_id is None else self.country[airport_id]
+
     def get_country_by_city(self, city_name):
-        if city_name is None:
-            return None
-        airport_data = self.df_airports[self.df_airports['City'].str.lower() == city_name.lower()]
-        if not airport_data.empty:
-            return airport_data.iloc[0]['HH_ISO']
-        else:
-            return None
+        airport_id = self._city_id(city_name)
+        return None if airport_id is None else self.country[airport_id]
+
+    # === Vectorized bulk resolvers ===
+
+    def airport_ids_by_iata(self, iata_codes):
+        """Airport ids for a column of IATA codes; -1 where the code is unknown or missing."""
+        positions = self._iata_index.get_indexer(pd.Index(pd.Series(iata_codes, dtype=object)))
+        return np.where(positions >= 0, self._iata_ids[positions], -1)
+
+    def lon_lat_by_iata(self, iata_codes):
+        """Longitude and latitude arrays for a column of IATA codes; NaN where the code is unknown."""
+        ids = self.airport_ids_by_iata(iata_codes)
+        known = ids >= 0
+        lon = np.where(known, self.lon[ids], np.nan)
+        lat = np.where(known, self.lat[ids], np.nan)
+        return lon, lat
+
+    def cities_by_iata(self, iata_codes):
+        """City names for a column of IATA codes; None where the code is unknown."""
+        ids = self.airport_ids_by_iata(iata_codes)
+        return np.where(ids >= 0, self.city[ids], None)
+
+    def countries_by_iata(self, iata_codes):
+        """ISO-3 country codes for a column of IATA codes; None where the code is unknown."""
+        ids = self.airport_ids_by_iata(iata_codes)
+        return np.where(ids >= 0, self.country[ids], None)
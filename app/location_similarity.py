@@ -1,10 +1,18 @@
 import math
+import re
+from functools import lru_cache
 from fuzzywuzzy import fuzz
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.metrics import jaccard_score
 import numpy as np
 import pandas as pd
 
+from app.name_scoring import ratio_scores
+from app.score_memo import score_distinct
+
+# CountVectorizer(analyzer='char') collapses whitespace runs before extracting n-grams
+_WHITE_SPACES = re.compile(r"\s\s+")
+
 
 def haversine(lon1, lat1, lon2, lat2):
     """
@@ -90,3 +98,109 @@ def location_matching(location1, location2):
     return 100 if str(location1).strip().lower() == str(location2).strip().lower() else 0
 
 
+def haversine_array(lon1, lat1, lon2, lat2):
+    """
+    Vectorized haversine distance in kilometers; accepts scalars or NumPy arrays.
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arcsin(np.sqrt(a))
+    r = 6371
+    return c * r
+
+def location_similarity_scores(lon1, lat1, lon2, lat2, max_distance):
+    """
+    Column-wise version of `location_similarity_score`.
+
+    Args:
+    lon1, lat1 (float): Query longitude and latitude.
+    lon2, lat2 (array-like): Candidate longitudes and latitudes.
+    max_distance (float): Maximum distance for normalization.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray]: Similarity scores and exponential scores (NaN where a coordinate is missing).
+    """
+    lon2 = pd.to_numeric(pd.Series(lon2), errors="coerce").to_numpy(dtype=float)
+    lat2 = pd.to_numeric(pd.Series(lat2), errors="coerce").to_numpy(dtype=float)
+    if lon1 is None or lat1 is None:
+        return np.full(len(lon2), np.nan), np.full(len(lon2), np.nan)
+
+    try:
+        lon1, lat1 = float(lon1), float(lat1)
+    except (ValueError, TypeError):
+        return np.full(len(lon2), np.nan), np.full(len(lon2), np.nan)
+
+    missing = np.isnan(lon2) | np.isnan(lat2)
+    distance = haversine_array(lon1, lat1, lon2, lat2)
+
+    ratio = (max_distance - distance) / max_distance
+    similarity_score = np.where(ratio > 0, ratio, 0) * 100
+    exp_score = np.exp(-distance / max_distance) * 100
+
+    similarity_score[missing] = np.nan
+    exp_score[missing] = np.nan
+    return similarity_score, exp_score
+
+def location_matching_column(location1, locations):
+    """
+    Column-wise version of `location_matching`: 100 on a case/whitespace-insensitive match, 0 otherwise, NaN where either side is missing.
+    Each distinct location is compared once.
+    """
+    locations = pd.Series(locations)
+    if isinstance(location1, pd.Series) or pd.isnull(location1):
+        return pd.Series(np.nan, index=locations.index)
+
+    query = str(location1).strip().lower()
+    scores = score_distinct(
+        locations, lambda uniques: np.where(uniques.astype(str).str.strip().str.lower() == query, 100.0, 0.0)
+    )
+    return pd.Series(scores, index=locations.index)
+
+@lru_cache(maxsize=100_000)
+def address_trigrams(address):
+    """
+    Character 3-grams of a lowercased, stripped address, as CountVectorizer(analyzer='char', ngram_range=(3, 3)) extracts them.
+    Cached per distinct address so repeated candidates are tokenized once.
+    """
+    text = _WHITE_SPACES.sub(" ", address)
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+def address_similarity_scores(address, addresses):
+    """
+    Bulk version of `address_str_similarity_score`: the query is tokenized once and every candidate is scored against it.
+
+    Args:
+    address (str): Query address.
+    addresses (array-like): Candidate addresses.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray]: Fuzzy ratio and trigram Jaccard scores (NaN where either address is missing or blank).
+    """
+    addresses = pd.Series(addresses)
+    str_similarity = np.full(len(addresses), np.nan)
+    jcd_score = np.full(len(addresses), np.nan)
+    if not address:
+        return str_similarity, jcd_score
+
+    query = address.lower().strip()
+    present = addresses.map(lambda value: isinstance(value, str))
+    candidates = addresses[present].str.lower().str.strip()
+    present_idx = np.flatnonzero(present.to_numpy())[(candidates != "").to_numpy()]
+    candidates = candidates[candidates != ""]
+    if not query or candidates.empty:
+        return str_similarity, jcd_score
+
+    str_similarity[present_idx] = ratio_scores(query, candidates, lowercase=False).to_numpy()
+
+    query_grams = address_trigrams(query)
+    jaccard = {}
+    for candidate in candidates.unique():
+        candidate_grams = address_trigrams(candidate)
+        union = len(query_grams | candidate_grams)
+        # No trigram on either side is an empty vocabulary for CountVectorizer
+        jaccard[candidate] = len(query_grams & candidate_grams) / union * 100 if union else np.nan
+    jcd_score[present_idx] = candidates.map(jaccard).to_numpy(dtype=float)
+
+    return str_similarity, jcd_score
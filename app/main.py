@@ -1,37 +1,122 @@
 import pandas as pd
 import numpy as np
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header
+from starlette.concurrency import run_in_threadpool
 import logging
+from typing import Optional
 
 
-from app.pipeline import run_similarity_pipeline
-from fastapi.responses import JSONResponse
+from app.admission import AdmissionRejected, admission_stats, run_admitted, stream_admitted
+from app.pipeline import iter_similarity_pipeline, run_similarity_pipeline, run_batch_similarity_pipeline
+from fastapi.responses import JSONResponse, StreamingResponse
 from app.loc_access import LocDataAccess
+from app.model_cache import cache_stats
+from app.result_cache import result_cache_stats
+from app.score_memo import score_memo_stats
+from app.serialization import encode_batch_result, encode_result, encode_stream, stream_media_type
+from app.tasks import app as celery_app, similarity_job
 
 
 
-from app.schemas import CombinedRequest
+from app.schemas import CombinedRequest, BatchCombinedRequest
 
 router = APIRouter()
 
+SHARDS = [
+    "2019-01-01_2019-02-28",
+    "2019-03-01_2019-04-30",
+    "2019-05-01_2019-06-30",
+    "2019-07-01_2019-08-31",
+    "2019-09-01_2019-10-31",
+    "2019-11-01_2019-12-31",
+]
+
 logging.basicConfig(
     level=logging.INFO,  # <-- show info-level logs
     format="%(asctime)s [%(levelname)s] %(message)s",
 )
 
 
+def busy_response(e: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"status": "error", "message": str(e)},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
 @router.post("/combined_operation")
-async def combined_operation(request: CombinedRequest):
+async def combined_operation(request: CombinedRequest, accept: Optional[str] = Header(default=None)):
     data = request.dict()
-    data["shards"] = [
-        "2019-01-01_2019-02-28",
-        "2019-03-01_2019-04-30",
-        "2019-05-01_2019-06-30",
-        "2019-07-01_2019-08-31",
-        "2019-09-01_2019-10-31",
-        "2019-11-01_2019-12-31",
-    ]
+    data["shards"] = SHARDS
     # data['shards'] = ["2019-01-01_2020-01-01"]  # For testing, use a single shard
-    result = run_similarity_pipeline(data)
-    return result
+    try:
+        result = await run_admitted(run_similarity_pipeline, data, records=False)
+    except AdmissionRejected as e:
+        return busy_response(e)
+    return encode_result(result, accept)
+
+
+@router.post("/combined_operation/stream")
+async def combined_operation_stream(request: CombinedRequest, accept: Optional[str] = Header(default=None)):
+    data = request.dict()
+    data["shards"] = SHARDS
+    try:
+        records = await stream_admitted(iter_similarity_pipeline(data))
+    except AdmissionRejected as e:
+        return busy_response(e)
+    media_type = stream_media_type(accept)
+    return StreamingResponse(encode_stream(records, media_type), media_type=media_type)
+
+
+@router.post("/batch_combined_operation")
+async def batch_combined_operation(request: BatchCombinedRequest, accept: Optional[str] = Header(default=None)):
+    items = []
+    for query in request.queries:
+        data = query.dict()
+        data["shards"] = SHARDS
+        items.append(data)
+    try:
+        result = await run_admitted(run_batch_similarity_pipeline, items, records=False)
+    except AdmissionRejected as e:
+        return busy_response(e)
+    return encode_batch_result(result, accept)
+
+
+@router.post("/jobs/combined_operation", status_code=202)
+async def submit_combined_operation(request: CombinedRequest):
+    payload = request.model_dump(mode="json")
+    payload["shards"] = SHARDS
+    job = await run_in_threadpool(lambda: similarity_job(payload).apply_async())
+    return {"job_id": job.id, "status": job.status}
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = celery_app.AsyncResult(job_id)
+    return {"job_id": job_id, "status": job.status, "ready": job.ready()}
+
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str, accept: Optional[str] = Header(default=None)):
+    job = celery_app.AsyncResult(job_id)
+    if not job.ready():
+        return JSONResponse(status_code=202, content={"job_id": job_id, "status": job.status})
+    if job.failed():
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(job.result)})
+    return encode_result(job.result, accept)
+
+
+@router.get("/cache_stats")
+async def shard_cache_stats():
+    return {**cache_stats(), "score_memo": score_memo_stats(), "result_cache": result_cache_stats()}
+
+
+@router.get("/pipeline_stats")
+async def pipeline_stats():
+    return admission_stats()
+
 
+@router.get("/health")
+async def health():
+    return {"status": "ok"}
@@ -1,17 +1,351 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
 import joblib
 import faiss
 import pandas as pd
-from functools import lru_cache
-
-@lru_cache(maxsize=2)  # hold up to 2 shards in RAM
-def load_model_bundle(shard_label: str):
-    return {
-        "encoder": joblib.load(f"model/encoder_{shard_label}.pkl"),
-        "scaler": joblib.load(f"model/scaler_{shard_label}.pkl"),
-        "tfidf_name": joblib.load(f"model/tfidf_name_{shard_label}.pkl"),
-        "tfidf_addr": joblib.load(f"model/tfidf_addr_{shard_label}.pkl"),
-        "svd_name": joblib.load(f"model/svd_name_{shard_label}.pkl"),
-        "svd_addr": joblib.load(f"model/svd_addr_{shard_label}.pkl"),
-        "index": faiss.read_index(f"model/faiss_IVF_{shard_label}.index", faiss.IO_FLAG_MMAP),
-        "metadata": pd.read_parquet(f"model/metadata_{shard_label}.parquet")
-    }
+import pyarrow as pa
+
+from app.config import (
+    COMPILED_EMBEDDER,
+    MODEL_CACHE_MAX_BYTES,
+    MODEL_CACHE_POLICY,
+    PREPROCESSOR_DIR,
+    SHARD_BUNDLE_VERIFY,
+    SHARD_PREFETCH,
+    SHARED_EMBEDDING_LABEL,
+    STRUCTURED_FILTER_COLUMNS,
+)
+from app.query_embedder import compile_query_embedder
+from app.shard_bundle import build_filter_codes, build_row_filters, bundle_dir, read_bundle, read_manifest
+
+PREPROCESSOR_NAMES = ["encoder", "scaler", "tfidf_name", "tfidf_addr", "svd_name", "svd_addr"]
+
+
+def bundle_paths(shard_label: str) -> dict:
+    paths = {name: f"{PREPROCESSOR_DIR}/{name}_{shard_label}.pkl" for name in PREPROCESSOR_NAMES + ["embedder"]}
+    paths["index"] = f"{PREPROCESSOR_DIR}/faiss_IVF_{shard_label}.index"
+    paths["metadata"] = f"{PREPROCESSOR_DIR}/metadata_{shard_label}.parquet"
+    return paths
+
+
+_shared_lock = threading.Lock()
+_shared = {}  # 'version' and 'preprocessors' of the last shared bundle load
+
+
+def load_shared_preprocessors() -> Optional[dict]:
+    """
+    The cross-shard preprocessing bundle written by training with SHARED_EMBEDDING, or None if there
+    is none. Loaded once and reloaded when its build version on disk changes (see `shard_version`);
+    the loaded version is kept under 'embedding_version'.
+    """
+    version = shard_version(SHARED_EMBEDDING_LABEL)
+    with _shared_lock:
+        if _shared and _shared["version"] == version:
+            return _shared["preprocessors"]
+        preprocessors = read_shared_preprocessors()
+        if preprocessors is not None:
+            preprocessors["embedding_version"] = version
+        _shared.update(version=version, preprocessors=preprocessors)
+        return preprocessors
+
+
+def read_shared_preprocessors() -> Optional[dict]:
+    path = bundle_dir(PREPROCESSOR_DIR, SHARED_EMBEDDING_LABEL)
+    if os.path.isdir(path):
+        logging.info(f"Loading shared embedder bundle {path}")
+        return {"embedder": read_bundle(path, verify=SHARD_BUNDLE_VERIFY)["embedder"]}
+
+    paths = bundle_paths(SHARED_EMBEDDING_LABEL)
+    if not all(os.path.exists(paths[name]) for name in PREPROCESSOR_NAMES):
+        return None
+    logging.info(f"Loading shared preprocessors '{SHARED_EMBEDDING_LABEL}'")
+    preprocessors = {name: joblib.load(paths[name]) for name in PREPROCESSOR_NAMES}
+    preprocessors["embedder"] = load_query_embedder(paths["embedder"], preprocessors)
+    return preprocessors
+
+
+def load_query_embedder(path: str, preprocessors: dict) -> Optional[dict]:
+    """
+    The precompiled query embedder exported at training time, compiled from the fitted
+    preprocessors if it was not exported, or None when COMPILED_EMBEDDER is off.
+    """
+    if not COMPILED_EMBEDDER:
+        return None
+    if os.path.exists(path):
+        return joblib.load(path)
+    return compile_query_embedder(preprocessors)
+
+
+def read_model_bundle(shard_label: str) -> dict:
+    """
+    Load a shard's preprocessors, FAISS index and metadata.
+
+    Shards converted to the consolidated format (`model/shard_<label>/`, see shard_bundle.py) are
+    memory-mapped; otherwise the legacy pickles and parquet are read. Shards trained with their own
+    preprocessors keep using them; shards without them use the shared bundle, flagged by
+    'shared_embedding' so callers can reuse one query embedding. 'version' is the build version
+    the bundle was loaded from (see `shard_version`).
+    """
+    path = bundle_dir(PREPROCESSOR_DIR, shard_label)
+    if os.path.isdir(path):
+        bundle = read_bundle(path, verify=SHARD_BUNDLE_VERIFY)
+        own_embedder = "embedder" in bundle
+    else:
+        paths = bundle_paths(shard_label)
+        own_embedder = os.path.exists(paths["encoder"])
+        # Taken before reading the files, so a shard rebuilt meanwhile is reloaded on next use
+        bundle = {"version": shard_version(shard_label)}
+        if own_embedder:
+            bundle.update({name: joblib.load(paths[name]) for name in PREPROCESSOR_NAMES})
+            bundle["embedder"] = load_query_embedder(paths["embedder"], bundle)
+        bundle["index"] = faiss.read_index(paths["index"], faiss.IO_FLAG_MMAP)
+        bundle["metadata"] = pd.read_parquet(paths["metadata"])
+        bundle.update(build_row_filters(bundle["metadata"], STRUCTURED_FILTER_COLUMNS))
+
+    missing_filters = [col for col in STRUCTURED_FILTER_COLUMNS if col not in bundle["filter_codes"]]
+    if missing_filters:
+        # Bundle written before these filter columns were configured
+        metadata = bundle["metadata"]
+        if isinstance(metadata, pa.Table):
+            metadata = metadata.select([col for col in missing_filters if col in metadata.column_names]).to_pandas()
+        bundle["filter_codes"].update(build_filter_codes(metadata, missing_filters))
+
+    if not own_embedder:
+        shared = load_shared_preprocessors()
+        if shared is None:
+            raise FileNotFoundError(f"Shard {shard_label} has no preprocessors and there is no shared bundle")
+        bundle.update(shared)
+    bundle["shared_embedding"] = not own_embedder
+    return bundle
+
+
+def shard_version(shard_label: str) -> Optional[str]:
+    """
+    Build version of a shard on disk, or None if there is no such shard: the manifest checksum
+    for consolidated bundles (the bundle's 'version'), and for legacy shards a digest of the
+    files' sizes and modification times. Changes whenever the shard is rebuilt or converted.
+    """
+    path = bundle_dir(PREPROCESSOR_DIR, shard_label)
+    if os.path.isdir(path):
+        return read_manifest(path)["checksum"]
+    stamps = []
+    for name, file_path in sorted(bundle_paths(shard_label).items()):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue
+        stamps.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+    if not stamps:
+        return None
+    return hashlib.sha256("\n".join(stamps).encode()).hexdigest()
+
+
+def bundle_nbytes(shard_label: str, bundle: dict) -> int:
+    """
+    Approximate resident footprint of a shard bundle in bytes.
+
+    Consolidated bundles are charged their mapped file size. For legacy bundles, the metadata frame
+    is measured in memory (deep, including strings); the FAISS index and the fitted preprocessors are
+    measured by their serialized size, which tracks their in-memory arrays. Shared preprocessors are
+    loaded once for all shards and not charged to any of them.
+    """
+    if "manifest" in bundle:
+        return bundle["nbytes"]
+    paths = bundle_paths(shard_label)
+    nbytes = int(bundle["metadata"].memory_usage(deep=True).sum())
+    own_files = ["index"] if bundle.get("shared_embedding") else PREPROCESSOR_NAMES + ["index"]
+    for name in own_files:
+        try:
+            nbytes += os.path.getsize(paths[name])
+        except OSError:
+            pass
+    nbytes += sum(bundle[name].nbytes for name in ("departure_ts", "arrival_ts") if name in bundle)
+    if bundle.get("embedder") is not None and not bundle.get("shared_embedding"):
+        nbytes += sum(bundle["embedder"][block]["projection"].nbytes for block in ("name", "address"))
+    nbytes += sum(codes.nbytes for codes, _ in bundle.get("filter_codes", {}).values())
+    return nbytes
+
+
+class ShardBundleCache:
+    """
+    Shard bundle cache bounded by a byte budget rather than an entry count.
+
+    Entries are evicted by least-recent ("lru") or least-frequent ("lfu", ties broken by recency)
+    use until the cached bundles fit in `max_bytes`. A bundle larger than the whole budget is still
+    cached on its own, so back-to-back queries on that shard do not reload it.
+
+    Loads are single-flight: concurrent misses on the same shard wait on one in-flight load
+    instead of each deserializing the bundle. `prefetch` warms shards on a background thread.
+    A cached bundle whose 'version' no longer matches `versioner(shard_label)` (the shard was
+    rebuilt on disk) is dropped and reloaded.
+    """
+
+    def __init__(self, loader, max_bytes: int, policy: str = "lru", sizer=bundle_nbytes, versioner=shard_version):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown cache policy: {policy}")
+        self._loader = loader
+        self._sizer = sizer
+        self._versioner = versioner
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._entries = OrderedDict()  # shard_label -> (bundle, nbytes), oldest use first
+        self._uses = {}
+        self._inflight = {}  # shard_label -> Future of the running load
+        self._lock = threading.Lock()
+        self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shard-prefetch")
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.prefetches = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+
+    def get(self, shard_label: str) -> dict:
+        version = self._versioner(shard_label) if self._versioner is not None else None
+        with self._lock:
+            entry = self._entries.get(shard_label)
+            if entry is not None and self._versioner is not None and entry[0].get("version") != version:
+                self._entries.pop(shard_label)
+                self._uses.pop(shard_label, None)
+                self.reloads += 1
+                logging.info(f"Shard {shard_label} changed on disk, reloading it")
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                self._uses[shard_label] += 1
+                self._entries.move_to_end(shard_label)
+                return entry[0]
+            self.misses += 1
+            future, owner = self._claim_load(shard_label)
+            if not owner:
+                self.coalesced += 1
+
+        if owner:
+            self._load(shard_label, future)
+        return future.result()
+
+    def prefetch(self, shard_labels):
+        """
+        Load shards in the background if they are not cached or loading and an average-sized
+        bundle still fits in the budget, so prefetching never evicts shards that are in use.
+        """
+        with self._lock:
+            cached_sizes = [nbytes for _, nbytes in self._entries.values()]
+            expected = sum(cached_sizes) / len(cached_sizes) if cached_sizes else 0
+            for shard_label in shard_labels:
+                if shard_label in self._entries or shard_label in self._inflight:
+                    continue
+                if self.current_bytes + expected * (len(self._inflight) + 1) > self.max_bytes:
+                    break
+                future, _ = self._claim_load(shard_label)
+                self.prefetches += 1
+                logging.info(f"Prefetching shard {shard_label}")
+                self._prefetcher.submit(self._load, shard_label, future)
+
+    def _claim_load(self, shard_label: str):
+        """Return the in-flight load for a shard and whether the caller owns it. Call with the lock held."""
+        future = self._inflight.get(shard_label)
+        if future is not None:
+            return future, False
+        future = Future()
+        self._inflight[shard_label] = future
+        return future, True
+
+    def _load(self, shard_label: str, future: Future):
+        try:
+            start = time.time()
+            bundle = self._loader(shard_label)
+            nbytes = self._sizer(shard_label, bundle)
+            elapsed = time.time() - start
+            logging.info(f"Loaded shard {shard_label} ({nbytes / 2**20:.1f} MiB) in {elapsed:.2f} seconds")
+        except BaseException as e:
+            logging.error(f"Failed to load shard {shard_label}: {e}")
+            with self._lock:
+                self._inflight.pop(shard_label, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self.loads += 1
+            self.load_seconds += elapsed
+            self._uses[shard_label] = 1
+            self._entries[shard_label] = (bundle, nbytes)
+            self._entries.move_to_end(shard_label)
+            self._evict(keep=shard_label)
+            self._inflight.pop(shard_label, None)
+        future.set_result(bundle)
+
+    def _evict(self, keep: str):
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            candidates = [label for label in self._entries if label != keep]
+            if self.policy == "lfu":
+                victim = min(candidates, key=lambda label: self._uses[label])
+            else:
+                victim = candidates[0]
+            _, nbytes = self._entries.pop(victim)
+            self._uses.pop(victim, None)
+            self.evictions += 1
+            logging.info(f"Evicted shard {victim} ({nbytes / 2**20:.1f} MiB) from the bundle cache")
+
+    @property
+    def current_bytes(self) -> int:
+        return sum(nbytes for _, nbytes in self._entries.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "max_bytes": self.max_bytes,
+                "current_bytes": self.current_bytes,
+                "shards": {label: nbytes for label, (_, nbytes) in self._entries.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "prefetches": self.prefetches,
+                "loading": sorted(self._inflight),
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+                "loads": self.loads,
+                "load_seconds": round(self.load_seconds, 4),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._uses.clear()
+
+
+_bundle_cache = ShardBundleCache(read_model_bundle, MODEL_CACHE_MAX_BYTES, MODEL_CACHE_POLICY)
+
+
+def load_model_bundle(shard_label: str) -> dict:
+    return _bundle_cache.get(shard_label)
+
+
+def loaded_versions(shard_labels) -> dict:
+    """
+    Build versions of the bundles searches use for `shard_labels` (loading them if needed), plus
+    the shared preprocessors' version under SHARED_EMBEDDING_LABEL.
+    """
+    versions = {shard_label: load_model_bundle(shard_label)["version"] for shard_label in shard_labels}
+    shared = load_shared_preprocessors()
+    versions[SHARED_EMBEDDING_LABEL] = None if shared is None else shared["embedding_version"]
+    return versions
+
+
+def prefetch_model_bundles(shard_labels) -> None:
+    if SHARD_PREFETCH:
+        _bundle_cache.prefetch(shard_labels)
+
+
+def cache_stats() -> dict:
+    return _bundle_cache.stats()
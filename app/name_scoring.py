@@ -0,0 +1,49 @@
+# app/name_scoring.py
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from app.score_memo import score_distinct
+
+
+def ratio_scores(query, candidates, lowercase=True, missing_value=0):
+    """
+    Score one query string against a whole candidate column in a single rapidfuzz call.
+
+    Scores match `fuzzywuzzy.fuzz.ratio` (backed by python-Levenshtein): the Indel ratio
+    scaled to 0-100 and rounded to an integer, with identical strings scoring 100.
+
+    Each distinct candidate is scored once and the scores of (query, candidate) pairs are
+    memoized across requests.
+
+    Args:
+        query (str): Query string.
+        candidates (array-like): Candidate strings.
+        lowercase (bool): Lowercase the query and candidates before scoring.
+        missing_value: Score for rows where the query or the candidate is missing or not a string.
+
+    Returns:
+        pd.Series: Scores aligned with `candidates`.
+    """
+    candidates = pd.Series(candidates)
+    valid = candidates.map(lambda value: isinstance(value, str))
+    if not isinstance(query, str) or not valid.any():
+        return pd.Series(missing_value, index=candidates.index)
+
+    choices = candidates[valid]
+    if lowercase:
+        query = query.lower()
+        choices = choices.str.lower()
+
+    def score(uniques):
+        scores = process.cdist([query], uniques.tolist(), scorer=fuzz.ratio, dtype=np.float64, workers=-1)[0]
+        # fuzzywuzzy rounds with Python's round(), i.e. half to even, same as np.rint
+        return np.rint(scores).astype(np.int64)
+
+    scores = score_distinct(choices, score, memo_namespace=("ratio", query)).astype(np.int64)
+
+    if valid.all():
+        return pd.Series(scores, index=candidates.index)
+    result = pd.Series(missing_value, index=candidates.index)
+    result[valid] = scores
+    return result
@@ -3,18 +3,20 @@ import numpy as np
 import logging
 import pandas as pd
 import time
+from typing import Iterable, Iterator, List, Optional, Tuple
+from app.candidate_merge import CandidateHeap
+from app.config import DEFAULT_TOP_K, MAX_CANDIDATES, MAX_EXPANSION_ROUNDS, MAX_NPROBE, MAX_TOP_K, STRUCTURED_FILTERS
 from app.loc_access import LocDataAccess
-from app.model_cache import load_model_bundle
-from app.faiss_search import faiss_search_with_metadata
-from app.embedding import embed_passengers
-from app.similarity_metrics import compute_similarity_features
-from app.utils import compute_relative_age, enrich_location, infer_shards_for_date, infer_shards_for_date_range
+from app.shard_search import iter_search_shards, search_shards_batch, shard_probes
+from app.response_fields import RESPONSE_RENAMES, response_columns
+from app.similarity_metrics import FEATURE_GROUPS, add_airport_geo_columns, compute_similarity_features
+from app.model_cache import loaded_versions, prefetch_model_bundles
+from app.result_cache import cache_candidates, candidate_cache_key, get_cached_candidates, result_cache_enabled
+from app.utils import adjacent_shards, compute_relative_age, enrich_location, infer_shards_for_date, infer_shards_for_date_range
 
-def run_similarity_pipeline(data: dict) -> dict:
-    airport_data_access = LocDataAccess.get_instance()
-    
-    # Prepare query
-    query = {
+
+def build_query(data: dict) -> dict:
+    return {
         "firstname": data.get("firstname", ""),
         "surname": data.get("surname", ""),
         "dob": data.get("dob", ""),
@@ -26,255 +28,416 @@ def run_similarity_pipeline(data: dict) -> dict:
         "iata_d": data.get("iata_d", ""),
     }
 
+
+def prepare_query_frame(query: dict) -> pd.DataFrame:
     # Enrich location
     query_df = pd.DataFrame([query])
     query_df = compute_relative_age(query_df)
     query_df = enrich_location(query_df)
+    return query_df
+
+
+def build_search_spec(data: dict) -> dict:
+    """
+    How each shard is searched for this request: the arrival date window plus any `strict_filters`
+    fields (e.g. sex, nationality) are pushed down into the FAISS search as filters, and `top_k`/`nprobe`
+    set the neighbours retrieved per shard and the IVF lists probed.
+    """
+    equals = {}
+    for field in data.get("strict_filters") or []:
+        value = data.get(field)
+        if value is not None and str(value).strip():
+            equals[STRUCTURED_FILTERS[field]] = value
+    return {
+        "arrival_date_from": data["arrival_date_from"],
+        "arrival_date_to": data["arrival_date_to"],
+        "equals": equals,
+        "top_k": data.get("top_k") or DEFAULT_TOP_K,
+        "nprobe": data.get("nprobe"),
+    }
+
+
+def expand_search_spec(search_spec: dict) -> Optional[dict]:
+    """
+    Next round of iterative deepening: double k and nprobe, or None once both caps are reached.
+    nprobe is capped at the indexes' `nlist` when the spec knows it (see `with_index_probes`).
+    """
+    top_k = min(search_spec["top_k"] * 2, MAX_TOP_K)
+    nprobe = min((search_spec["nprobe"] or 1) * 2, MAX_NPROBE, search_spec.get("nlist") or MAX_NPROBE)
+    if top_k == search_spec["top_k"] and nprobe == search_spec["nprobe"]:
+        return None
+    return dict(search_spec, top_k=top_k, nprobe=nprobe)
+
+
+def with_index_probes(search_spec: dict, probes: Optional[Tuple[int, int]]) -> dict:
+    """
+    The spec with the nprobe actually searched, given the (default nprobe, nlist) of the searched
+    IVF indexes: the index default when the request left `nprobe` unset, and at most `nlist`.
+    Expansion then doubles from that nprobe, and the summary reports it.
+    """
+    if probes is None:
+        return search_spec
+    default_nprobe, nlist = probes
+    nprobe = default_nprobe if search_spec["nprobe"] is None else search_spec["nprobe"]
+    return dict(search_spec, nprobe=min(nprobe, nlist), nlist=nlist)
+
+
+def searched_spec(search_spec: dict, shard_labels: List[str]) -> dict:
+    """
+    `with_index_probes` for a search of `shard_labels`.
+    """
+    if "nlist" in search_spec:
+        return search_spec
+    return with_index_probes(search_spec, shard_probes(shard_labels))
+
+
+def needs_expansion(data: dict, result: dict, rounds: int) -> bool:
+    return len(result["data"]) < (data.get("min_results") or 0) and rounds < MAX_EXPANSION_ROUNDS
+
+
+def within_arrival_window(data: dict, matches: pd.DataFrame) -> pd.DataFrame:
+    matches = matches.copy()
+    matches["departure_time"] = pd.to_datetime(matches["departure_time"], errors="coerce")
+    matches["arrival_time"] = pd.to_datetime(matches["arrival_time"], errors="coerce")
+    return matches[
+        (matches["departure_time"] >= data["arrival_date_from"]) &
+        (matches["arrival_time"] <= data["arrival_date_to"])
+    ]
+
+
+# Cheap-first cascade: the features `nameThreshold` and `ageThreshold` are checked against are computed
+# for every candidate, all other feature groups only for the candidates that pass the thresholds
+THRESHOLD_FEATURES = ["names", "age"]
+DEFERRED_FEATURES = [name for name in FEATURE_GROUPS if name not in THRESHOLD_FEATURES]
+THRESHOLD_COLUMNS = [col for name in THRESHOLD_FEATURES for col in FEATURE_GROUPS[name]]
+
+COMPOUND_SCORE_WEIGHTS = {
+    "FNSimilarity": 0.35,
+    "SNSimilarity": 0.25,
+    "DOBSimilarity": 0.10,
+    "AgeSimilarity": 0.05,
+    "strAddressSimilarity": 0.10,
+    "originSimilarity": 0.075,
+    "destinationSimilarity": 0.075,
+}
+
+# Response columns the candidates' airport cities/countries are needed for
+GEO_COLUMNS = ["OriginCity", "DestinationCity", "OriginCountry", "DestinationCountry"]
+
+
+def deferred_feature_groups(columns: List[str]) -> List[str]:
+    """
+    Deferred feature groups a response needs: those feeding the compound score plus those with
+    a requested column. Other groups are never computed.
+    """
+    needed = set(columns) | set(COMPOUND_SCORE_WEIGHTS)
+    return [name for name in DEFERRED_FEATURES if needed.intersection(FEATURE_GROUPS[name])]
+
+
+def threshold_mask(data: dict, threshold_features: pd.DataFrame) -> pd.Series:
+    """
+    Candidates passing the name (and, when the query has a DOB, age) thresholds.
+    """
+    scores = threshold_features.replace([np.inf, -np.inf], np.nan).fillna(0)
+    filters = (
+        (scores["FNSimilarity"] >= data.get("nameThreshold", 30)) &
+        (scores["SNSimilarity"] >= data.get("nameThreshold", 30))
+    )
+
+    if data.get("dob", "").strip():
+        filters &= (scores["AgeSimilarity"] >= data.get("ageThreshold", 20))
+    return filters
+
+
+def merge_shard_matches(data: dict, shard_matches: Iterable[Tuple[int, pd.DataFrame]]) -> pd.DataFrame:
+    """
+    Streaming k-way merge of per-shard FAISS hits.
+
+    Each shard's hits are filtered to the arrival window as they arrive and pushed into a bounded
+    heap, so only the `max_candidates` closest candidates across all shards reach the feature engine.
+    """
+    heap = CandidateHeap(data.get("max_candidates") or MAX_CANDIDATES)
+    for shard_position, matches in shard_matches:
+        heap.push(shard_position, within_arrival_window(data, matches))
+    logging.info(f"Kept {len(heap)} of {heap.pushed} candidates in the arrival window")
+    return heap.to_frame()
+
+
+def search_summary(search_spec: dict, rounds: int) -> dict:
+    return {
+        "top_k": search_spec["top_k"],
+        "nprobe": search_spec["nprobe"],
+        "expansion_rounds": rounds,
+    }
+
+
+def search_candidates(data: dict, query: dict, query_df: pd.DataFrame, shard_labels: List[str], search_spec: dict) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Search the shards, merge the hits and score the candidates on the threshold features.
+
+    The candidates and their threshold features do not depend on the thresholds, so they are kept
+    in the result cache (see app/result_cache.py) and reruns of the same search, e.g. with other
+    thresholds, skip the search and only re-filter.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: The candidates, and their threshold features
+    """
+    key = None
+    if result_cache_enabled():
+        shard_versions = loaded_versions(shard_labels)
+        key = candidate_cache_key(query, search_spec, data.get("max_candidates") or MAX_CANDIDATES, shard_versions)
+        cached = get_cached_candidates(key)
+        if cached is not None:
+            logging.info(f"Using {len(cached)} cached candidates")
+            return cached.drop(columns=THRESHOLD_COLUMNS), cached[THRESHOLD_COLUMNS]
+
+    matches = merge_shard_matches(data, iter_search_shards(shard_labels, query_df, search_spec))
+    threshold_df = threshold_features(query, matches)
+    if key is not None:
+        # Only cache under the key's versions if no shard was reloaded while it was being searched
+        if loaded_versions(shard_labels) == shard_versions:
+            cache_candidates(key, pd.concat([matches, threshold_df], axis=1))
+        else:
+            logging.info("Not caching candidates: a shard was reloaded during the search")
+    return matches, threshold_df
+
+
+def run_similarity_pipeline(data: dict, records: bool = True) -> dict:
+    """
+    Search the shards covering the request's date range and score the candidates. The matches are
+    returned under `data` as a list of records, or as the result DataFrame when `records` is False.
+    """
+    # Prepare query
+    query = build_query(data)
+    query_df = prepare_query_frame(query)
 
     # shard_label = infer_shards_for_date(data["arrival_date_from"], data["shards"])
     # models = load_model_bundle(shard_label)
     shard_labels = infer_shards_for_date_range(data["arrival_date_from"], data["arrival_date_to"], data["shards"])
-    all_matches = []
+    prefetch_model_bundles(adjacent_shards(shard_labels, data["shards"]))
 
+    search_spec = build_search_spec(data)
+    rounds = 0
+    while True:
+        start_time = time.time()
+        logging.info(f"Starting similarity search for query: {query} across shards length {len(shard_labels)} (top_k={search_spec['top_k']}, nprobe={search_spec['nprobe']})")
+        matches, threshold_df = search_candidates(data, query, query_df, shard_labels, search_spec)
+        search_spec = searched_spec(search_spec, shard_labels)
+        end_time = time.time()
+        logging.info(f"Similarity search completed in {end_time - start_time:.2f} seconds")
+
+        result = score_matches(data, query, matches, shard_labels, records=records, threshold_df=threshold_df)
+        next_spec = expand_search_spec(search_spec) if needs_expansion(data, result, rounds) else None
+        if next_spec is None:
+            break
+        logging.info(f"Only {len(result['data'])} of {data.get('min_results')} requested matches, expanding the search")
+        search_spec = next_spec
+        rounds += 1
+
+    result["search"] = search_summary(search_spec, rounds)
+    return result
+
+
+def iter_similarity_pipeline(data: dict) -> Iterator[dict]:
+    """
+    Streaming variant of `run_similarity_pipeline`: yields one result per shard as soon as that
+    shard's candidates are scored, in completion order, then a summary.
+
+    Each shard's candidates are capped at `max_candidates` and scored on their own, so a shard
+    record holds that shard's matches sorted by compound score; there is no cross-shard ranking and
+    no `min_results` expansion. Only one shard's matches are held at a time.
+
+    Yields:
+        dict: {"record": "shard", "shard": label, "status", "data" (DataFrame), ["message"]} per
+            shard, then {"record": "summary", "status", "shards", "matches", "search"}
+    """
+    query = build_query(data)
+    query_df = prepare_query_frame(query)
+    shard_labels = infer_shards_for_date_range(data["arrival_date_from"], data["arrival_date_to"], data["shards"])
+    prefetch_model_bundles(adjacent_shards(shard_labels, data["shards"]))
+
+    search_spec = build_search_spec(data)
+    total = 0
     start_time = time.time()
-    logging.info(f"Starting similarity search for query: {query} across shards length {len(shard_labels)}")
-    for shard_label in shard_labels:
-        models = load_model_bundle(shard_label)
-        
-        embedding, *_ = embed_passengers(
-            query_df,
-            models["encoder"],
-            models["scaler"],
-            models["tfidf_name"],
-            models["tfidf_addr"],
-            models["svd_name"],
-            models["svd_addr"]
-        )
-        embedding = np.nan_to_num(embedding.astype("float32"))
-
-        shard_matches = faiss_search_with_metadata(
-            embedding, 
-            models["index"], 
-            models["metadata"]["travel_doc"].values, 
-            models["metadata"]
-        )
-
-        all_matches.append(shard_matches)
-    end_time = time.time()
-    logging.info(f"Similarity search completed in {end_time - start_time:.2f} seconds")
-    
-
-
-    matches = pd.concat(all_matches, ignore_index=True)
-    matches["departure_time"] = pd.to_datetime(matches["departure_time"], errors="coerce")
-    matches["arrival_time"] = pd.to_datetime(matches["arrival_time"], errors="coerce")
+    for position, shard_matches in iter_search_shards(shard_labels, query_df, search_spec):
+        matches = merge_shard_matches(data, [(position, shard_matches)])
+        result = score_matches(data, query, matches, [shard_labels[position]], records=False)
+        total += len(result["data"])
+        yield {"record": "shard", "shard": shard_labels[position], **result}
+    search_spec = searched_spec(search_spec, shard_labels)
+    logging.info(f"Streamed {total} matches from {len(shard_labels)} shards in {time.time() - start_time:.2f} seconds")
 
-    matches = matches[
-        (matches["departure_time"] >= data["arrival_date_from"]) &
-        (matches["arrival_time"] <= data["arrival_date_to"])
+    yield {
+        "record": "summary",
+        "status": "success",
+        "shards": len(shard_labels),
+        "matches": total,
+        "search": search_summary(search_spec, 0),
+    }
+
+
+def run_batch_similarity_pipeline(items: List[dict], records: bool = True) -> dict:
+    """
+    Screen many query profiles at once.
+
+    Queries are grouped by shard so each shard embeds its queries in one `embed_passengers`
+    call and answers them with one multi-row FAISS search. Queries with too few matches for their
+    `min_results` are searched again with a wider spec. Results are returned in request order,
+    each with its matches as records or, when `records` is False, as a DataFrame.
+    """
+    queries = [build_query(data) for data in items]
+    query_frames = [prepare_query_frame(query) for query in queries]
+    search_specs = [build_search_spec(data) for data in items]
+    shard_labels_per_query = [
+        infer_shards_for_date_range(data["arrival_date_from"], data["arrival_date_to"], data["shards"])
+        for data in items
     ]
-    logging.info(f"Found {len(matches)} matches across shards: {shard_labels}")
-    if matches.empty:
-        return {
-            "status": "success",
-            "message": "There are no similar passengers found.",
-            "data": []
-            }
 
-    # Get additional fields
+    results = [None] * len(items)
+    rounds = [0] * len(items)
+    pending = list(range(len(items)))
+    while pending:
+        shard_plan = {}
+        for position in pending:
+            for shard_label in shard_labels_per_query[position]:
+                shard_plan.setdefault(shard_label, []).append(position)
+
+        start_time = time.time()
+        logging.info(f"Starting batch similarity search for {len(pending)} queries across shards length {len(shard_plan)}")
+        matches_per_query = search_shards_batch(shard_plan, query_frames, search_specs)
+        end_time = time.time()
+        logging.info(f"Batch similarity search completed in {end_time - start_time:.2f} seconds")
+
+        still_pending = []
+        for position in pending:
+            data = items[position]
+            search_specs[position] = searched_spec(search_specs[position], shard_labels_per_query[position])
+            matches = merge_shard_matches(data, enumerate(matches_per_query[position]))
+            results[position] = score_matches(data, queries[position], matches, shard_labels_per_query[position], records=records)
+            next_spec = expand_search_spec(search_specs[position]) if needs_expansion(data, results[position], rounds[position]) else None
+            if next_spec is not None:
+                search_specs[position] = next_spec
+                rounds[position] += 1
+                still_pending.append(position)
+        pending = still_pending
+
+    for position, result in enumerate(results):
+        result["search"] = search_summary(search_specs[position], rounds[position])
+    return {
+        "status": "success",
+        "results": results
+    }
+
+
+def similarity_feature_args(query: dict) -> dict:
+    """
+    Arguments of `compute_similarity_features` for a query: its fields plus the coordinates,
+    cities and countries of its airports and city.
+    """
+    airport_data_access = LocDataAccess.get_instance()
     lon_o, lat_o = airport_data_access.get_airport_lon_lat_by_iata(query["iata_o"])
     lon_d, lat_d = airport_data_access.get_airport_lon_lat_by_iata(query["iata_d"])
-    lon_c, lat_c = airport_data_access.get_airport_lon_lat_by_city(query["city"])
-    country = airport_data_access.get_country_by_city(query["city"])
-    ctry_org = airport_data_access.get_country_by_airport_iata(query["iata_o"])
-    ctry_dest = airport_data_access.get_country_by_airport_iata(query["iata_d"])
-    city_org = airport_data_access.get_city_by_airport_iata(query["iata_o"])
-    city_dest = airport_data_access.get_city_by_airport_iata(query["iata_d"])
-
-    sim_df = compute_similarity_features(
-        matches,
+    return dict(
         firstname=query["firstname"],
         surname=query["surname"],
         dob=query["dob"],
         address=query["address"],
         city_name=query["city"],
-        country=country,
+        country=airport_data_access.get_country_by_city(query["city"]),
         sex=query["gender"],
         nationality=query["nationality"],
         iata_o=query["iata_o"],
-        city_org=city_org,
-        ctry_org=ctry_org,
+        city_org=airport_data_access.get_city_by_airport_iata(query["iata_o"]),
+        ctry_org=airport_data_access.get_country_by_airport_iata(query["iata_o"]),
         iata_d=query["iata_d"],
-        city_dest=city_dest,
-        ctry_dest=ctry_dest,
+        city_dest=airport_data_access.get_city_by_airport_iata(query["iata_d"]),
+        ctry_dest=airport_data_access.get_country_by_airport_iata(query["iata_d"]),
         lon_o=lon_o,
         lat_o=lat_o,
         lon_d=lon_d,
         lat_d=lat_d,
     )
 
-    enriched_matches = pd.concat([matches, sim_df], axis=1)
 
-    # Replace invalid values before filtering
-    enriched_matches.replace([np.inf, -np.inf], np.nan, inplace=True)
-    enriched_matches.fillna(0, inplace=True)
+def threshold_features(query: dict, matches: pd.DataFrame) -> pd.DataFrame:
+    """
+    The features `threshold_mask` checks, for every candidate.
+    """
+    if matches.empty:
+        return pd.DataFrame(index=matches.index, columns=THRESHOLD_COLUMNS, dtype=float)
+    return compute_similarity_features(matches, features=THRESHOLD_FEATURES, **similarity_feature_args(query))
 
 
+def score_matches(data: dict, query: dict, matches: pd.DataFrame, shard_labels: List[str], records: bool = True, threshold_df: Optional[pd.DataFrame] = None) -> dict:
+    """
+    Filter the candidates on the name and age thresholds and score the survivors. `threshold_df`
+    holds the candidates' threshold features when they are already computed (see `search_candidates`).
+    """
+    columns = response_columns(data)
 
-    # Apply filters
-    filters = (
-        (enriched_matches["FNSimilarity"] >= data.get("nameThreshold", 30)) &
-        (enriched_matches["SNSimilarity"] >= data.get("nameThreshold", 30))
-    )
+    logging.info(f"Found {len(matches)} matches across shards: {shard_labels}")
+    if matches.empty:
+        return {
+            "status": "success",
+            "message": "There are no similar passengers found.",
+            "data": [] if records else pd.DataFrame(columns=columns)
+            }
 
-    if data.get("dob", "").strip():
-        filters &= (enriched_matches["AgeSimilarity"] >= data.get("ageThreshold", 20))
+    feature_args = similarity_feature_args(query)
+    if threshold_df is None:
+        threshold_df = compute_similarity_features(matches, features=THRESHOLD_FEATURES, **feature_args)
+
+    # Apply filters on the threshold features, then compute the rest for the survivors only,
+    # and only the feature groups the response columns and the compound score need
+    passed = threshold_mask(data, threshold_df)
+    survivors = matches[passed].copy()
+    logging.info(f"{len(survivors)} of {len(matches)} matches pass the name and age thresholds")
+    sim_df = compute_similarity_features(survivors, features=deferred_feature_groups(columns), **feature_args)
+    if "OriginCity" not in survivors.columns and any(col in columns for col in GEO_COLUMNS):
+        add_airport_geo_columns(survivors)
+
+    filtered_matches = pd.concat([survivors, threshold_df[passed], sim_df], axis=1)
 
-    filtered_matches = enriched_matches[filters]
+    # Replace invalid values
+    filtered_matches.replace([np.inf, -np.inf], np.nan, inplace=True)
+    filtered_matches.fillna(0, inplace=True)
 
     # Now compute compound score
-    filtered_matches["Compound Similarity Score"] = (
-        0.35 * filtered_matches["FNSimilarity"] +
-        0.25 * filtered_matches["SNSimilarity"] +
-        0.10 * filtered_matches["DOBSimilarity"] +
-        0.05 * filtered_matches["AgeSimilarity"] +
-        0.10 * filtered_matches["strAddressSimilarity"] +
-        0.075 * filtered_matches["originSimilarity"] +
-        0.075 * filtered_matches["destinationSimilarity"]
+    filtered_matches["Compound Similarity Score"] = sum(
+        weight * filtered_matches[col] for col, weight in COMPOUND_SCORE_WEIGHTS.items()
     ).round(4)
-    filtered_matches = filtered_matches.sort_values(by="Compound Similarity Score", ascending=False)
-
-    rename_map = {
-        "booking_ref": "BookingID",
-        "travel_doc": "TravelDocNumber",
-        "firstname": "Firstname",
-        "surname": "Surname",
-        "dob": "DOB",
-        "gender": "Sex",
-        "nationality": "Nationality",
-        "city": "CityName",
-        "address": "Address",
-        "departure_time": "DepartureDateTime",
-        "arrival_time": "ArrivalDateTime",
-        "departure_airport": "OriginIATA",
-        "arrival_airport": "DestinationIATA",
-        "flight_number": "FlightNumber",
-        "carrier": "OriginatorAirlineCode",
-        "dep_lat": "OriginLat",
-        "dep_lon": "OriginLon",
-        "arr_lat": "DestinationLat",
-        "arr_lon": "DestinationLon",
-        "OriginCity": "OriginCity",
-        "DestinationCity": "DestinationCity",
-        "OriginCountry": "OriginCountry",
-        "DestinationCountry": "DestinationCountry",
-        "faiss_distance": "FAISS Distance",
-        "confidence_score": "Confidence Level",
-        "FNSimilarity": "FNSimilarity",
-        "SNSimilarity": "SNSimilarity",
-        "DOBSimilarity": "DOBSimilarity",
-        "DOB1": "DOB1",
-        "DOB2": "DOB2",
-        "DOB_rarity1": "DOB_rarity1",
-        "DOB_rarity2": "DOB_rarity2",
-        "DOB_prob1": "DOB_prob1",
-        "DOB_prob2": "DOB_prob2",
-        "AgeSimilarity": "AgeSimilarity",
-        "strAddressSimilarity": "strAddressSimilarity",
-        "jcdAddressSimilarity": "jcdAddressSimilarity",
-        "cityAddressMatch": "cityAddressMatch",
-        "countryAddressMatch": "countryAddressMatch",
-        "sexMatch": "sexMatch",
-        "natMatch": "natMatch",
-        "originAirportMatch": "originAirportMatch",
-        "destinationAirportMatch": "destinationAirportMatch",
-        "orgdesAirportMatch": "orgdesAirportMatch",
-        "desorgAirportMatch": "desorgAirportMatch",
-        "originCityMatch": "originCityMatch",
-        "destinationCityMatch": "destinationCityMatch",
-        "orgdesCityMatch": "orgdesCityMatch",
-        "desorgCityMatch": "desorgCityMatch",
-        "originCountryMatch": "originCountryMatch",
-        "destinationCountryMatch": "destinationCountryMatch",
-        "orgdesCountryMatch": "orgdesCountryMatch",
-        "desorgCountryMatch": "desorgCountryMatch",
-        "originSimilarity": "originSimilarity",
-        "originExpScore": "originExpScore",
-        "destinationSimilarity": "destinationSimilarity",
-        "destinationExpScore": "destinationExpScore",
-        "orgdesSimilarity": "orgdesSimilarity",
-        "orgdesExpScore": "orgdesExpScore",
-        "desorgSimilarity": "desorgSimilarity",
-        "desorgExpScore": "desorgExpScore",
-        "Compound Similarity Score": "Compound Similarity Score",
-        "country": "Country of Address",
-    }
+    filtered_matches = filtered_matches.sort_values(by="Compound Similarity Score", ascending=False, kind="stable")
 
     # Apply renaming
-    filtered_matches.rename(columns=rename_map, inplace=True)
+    filtered_matches.rename(columns=RESPONSE_RENAMES, inplace=True)
 
     # Optional: fill in constant or missing fields
-    filtered_matches["FullName"] = filtered_matches["Firstname"] + " " + filtered_matches["Surname"]
-    filtered_matches["PlaceOfIssue"] = filtered_matches["Nationality"]
-    filtered_matches["PassengerID"] = ""  # or generate UUIDs
-    filtered_matches["PNRID"] = ""
-    filtered_matches["iata_pnrgov_notif_rq_id"] = ""
-    filtered_matches["unique_id"] = 0
-    filtered_matches["CityLat"] = ""
-    filtered_matches["CityLon"] = ""
-    filtered_matches["Confidence Level"] = (filtered_matches["Confidence Level"].fillna(0) * 100).round(4)
-
-    ordered_columns = [
-    "unique_id", "PassengerID", "PNRID", "iata_pnrgov_notif_rq_id",
-    "OriginIATA", "DestinationIATA", "FlightLegFlightNumber",  # optional alias
-    "OriginatorAirlineCode", "FlightNumber", "DepartureDateTime", "ArrivalDateTime",
-    "BookingID", "Firstname", "Surname", "FullName", "TravelDocNumber", "PlaceOfIssue",
-    "DOB", "Nationality", "Sex", "CityName", "Address",
-    "OriginLat", "OriginLon", "DestinationLat", "DestinationLon", "CityLat", "CityLon",
-    "OriginCity", "DestinationCity", "OriginCountry", "DestinationCountry", "Country of Address", "FAISS Distance", 
-    "Confidence Level", "FNSimilarity", "FN1", "FN2", "FN_rarity1", "FN_rarity2", "FN_prob1", "FN_prob2",
-    "SNSimilarity", "SN1", "SN2", "SN_rarity1", "SN_rarity2", "SN_prob1", "SN_prob2",
-    "DOBSimilarity", "DOB1", "DOB2", "DOB_rarity1", "DOB_rarity2", "DOB_prob1", "DOB_prob2",
-    "AgeSimilarity", "strAddressSimilarity", "jcdAddressSimilarity", "cityAddressMatch",
-    "cityAddressRarity1", "cityAddressProb1", "cityAddressRarity2", "cityAddressProb2",
-    "countryAddressMatch", "countryAddressRarity2", "countryAddressProb2",
-    "sexMatch", "sexRarity2", "sexProb2", "natMatch", "natRarity2", "natProb2",
-    "originAirportMatch", "originAirportRarity2", "originAirportProb2",
-    "destinationAirportMatch", "destinationAirportRarity2", "destinationAirportProb2",
-    "orgdesAirportMatch", "desorgAirportMatch",
-    "originCityMatch", "originCityRarity2", "originCityProb2",
-    "destinationCityMatch", "destinationCityRarity2", "destinationCityProb2",
-    "orgdesCityMatch", "desorgCityMatch",
-    "originCountryMatch", "originCountryRarity2", "originCountryProb2",
-    "destinationCountryMatch", "destinationCountryRarity2", "destinationCountryProb2",
-    "orgdesCountryMatch", "desorgCountryMatch",
-    "originSimilarity", "originExpScore",
-    "destinationSimilarity", "destinationExpScore",
-    "orgdesSimilarity", "orgdesExpScore",
-    "desorgSimilarity", "desorgExpScore",
-    "Compound Similarity Score"]
-
-
-    existing_ordered_cols = [col for col in ordered_columns if col in filtered_matches.columns]
-    filtered_matches = filtered_matches[existing_ordered_cols]
-
-    filtered_matches_json = filtered_matches.to_dict(orient="records")
-
-    # Copy logic from inside your Celery task here
-    
-    
+    derived_columns = {
+        "FullName": lambda df: df["Firstname"] + " " + df["Surname"],
+        "PlaceOfIssue": lambda df: df["Nationality"],
+        "PassengerID": lambda df: "",  # or generate UUIDs
+        "PNRID": lambda df: "",
+        "iata_pnrgov_notif_rq_id": lambda df: "",
+        "unique_id": lambda df: 0,
+        "CityLat": lambda df: "",
+        "CityLon": lambda df: "",
+        "Confidence Level": lambda df: (df["Confidence Level"].fillna(0) * 100).round(4),
+    }
+    for col, derive in derived_columns.items():
+        if col in columns:
+            filtered_matches[col] = derive(filtered_matches)
 
+    existing_ordered_cols = [col for col in columns if col in filtered_matches.columns]
+    filtered_matches = filtered_matches[existing_ordered_cols]
 
-    ...
-    
-    if not filtered_matches_json:
+    if filtered_matches.empty:
         return {
             "status": "success",
             "message": "No similar passengers found.",
-            "data": []
+            "data": [] if records else filtered_matches
         }
 
     return {
         "status": "success",
-        "data": filtered_matches_json
+        "data": filtered_matches.to_dict(orient="records") if records else filtered_matches
     }
@@ -0,0 +1,182 @@
+# app/query_embedder.py
+"""
+Precompiled query embedder: the `embed_passengers` transform chain reduced to plain NumPy arrays.
+
+`compile_query_embedder` turns a fitted preprocessing bundle (encoder, scaler, TF-IDF, SVD) into a
+dict of arrays - scaler mean/scale, a category -> column map and, per text block, the char n-gram
+vocabulary with the IDF weights folded into the SVD components as an (n-gram -> projected row)
+matrix. `embed_compiled` then embeds query rows with dictionary lookups and one small matmul per
+text block, without sklearn's per-call validation.
+
+The compiled form only holds NumPy arrays and builtins, so it can be exported at training time
+with joblib and loaded by the API without importing this module.
+"""
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# Block weights, as applied in embedding.embed_passengers
+NUMERIC_WEIGHT = 0.1
+CATEGORICAL_COLUMN_WEIGHTS = {0: 0.5, 1: 0.4}  # 'sex' and 'nationality' columns of the one-hot block
+NAME_WEIGHT = 1.5
+ADDRESS_WEIGHT = 0.8
+
+_WHITE_SPACES = re.compile(r"\s\s+")
+_NON_WORD = re.compile(r"[^\w]")
+
+
+def char_wb_ngrams(text: str, min_n: int, max_n: int) -> list:
+    """
+    Char n-grams inside word boundaries, padded with a space at each edge (sklearn's 'char_wb' analyzer).
+    """
+    text = _WHITE_SPACES.sub(" ", text)
+    ngrams = []
+    for word in text.split():
+        word = " " + word + " "
+        word_len = len(word)
+        for n in range(min_n, max_n + 1):
+            offset = 0
+            ngrams.append(word[offset:offset + n])
+            while offset + n < word_len:
+                offset += 1
+                ngrams.append(word[offset:offset + n])
+            if offset == 0:  # a short word is counted once
+                break
+    return ngrams
+
+
+def _compile_text_block(tfidf, svd, weight: float) -> dict:
+    return {
+        "vocabulary": {ngram: int(col) for ngram, col in tfidf.vocabulary_.items()},
+        "ngram_range": tuple(tfidf.ngram_range),
+        "idf": tfidf.idf_.astype(np.float64),
+        # row j: the projection of a unit count of n-gram j, before L2 normalization
+        "projection": (tfidf.idf_[:, None] * svd.components_.T * weight).astype(np.float64),
+    }
+
+
+def compile_query_embedder(preprocessors: dict) -> dict:
+    """
+    Compile a fitted preprocessing bundle into the arrays used by `embed_compiled`.
+
+    Args:
+        preprocessors (dict): 'encoder', 'scaler', 'tfidf_name', 'tfidf_addr', 'svd_name', 'svd_addr'
+
+    Returns:
+        dict: Plain arrays and lookup tables (see module docstring)
+    """
+    scaler = preprocessors["scaler"]
+    encoder = preprocessors["encoder"]
+
+    category_columns = []
+    offset = 0
+    for categories in encoder.categories_:
+        category_columns.append({value: offset + col for col, value in enumerate(categories)})
+        offset += len(categories)
+    categorical_weights = np.ones(offset, dtype=np.float64)
+    for col, weight in CATEGORICAL_COLUMN_WEIGHTS.items():
+        if col < offset:
+            categorical_weights[col] = weight
+
+    return {
+        "numeric_features": list(scaler.feature_names_in_),
+        "numeric_mean": scaler.mean_.astype(np.float64),
+        "numeric_scale": scaler.scale_.astype(np.float64),
+        "categorical_features": list(encoder.feature_names_in_),
+        "category_columns": category_columns,
+        "categorical_weights": categorical_weights,
+        "name": _compile_text_block(preprocessors["tfidf_name"], preprocessors["svd_name"], NAME_WEIGHT),
+        "address": _compile_text_block(preprocessors["tfidf_addr"], preprocessors["svd_addr"], ADDRESS_WEIGHT),
+    }
+
+
+def _normalize_text(value) -> str:
+    # Same as embedding.normalize_text: lowercase, keep letters and digits only
+    if value is None or pd.isna(value):
+        return ""
+    return _NON_WORD.sub("", str(value).lower())
+
+
+def _numeric_column(values: pd.Series) -> np.ndarray:
+    # Numeric columns are taken as they are; others are coerced, with unparseable values as NaN
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _embed_text(texts, block: dict) -> np.ndarray:
+    """
+    TF-IDF + SVD of `texts` for one text block. The n-grams of each distinct text are counted once,
+    then all texts are projected and normalized together with segmented sums over one flat array.
+    """
+    vocabulary, idf, projection = block["vocabulary"], block["idf"], block["projection"]
+    min_n, max_n = block["ngram_range"]
+    distinct = {}
+    codes = np.fromiter((distinct.setdefault(text, len(distinct)) for text in texts), dtype=np.intp, count=len(texts))
+    cols, tf, lengths = [], [], []
+    for text in distinct:
+        counts = Counter(vocabulary[ngram] for ngram in char_wb_ngrams(text.lower(), min_n, max_n) if ngram in vocabulary)
+        cols.extend(counts.keys())
+        tf.extend(counts.values())
+        lengths.append(len(counts))
+
+    out = np.zeros((len(distinct), projection.shape[1]), dtype=np.float64)
+    if cols:
+        cols = np.asarray(cols, dtype=np.intp)
+        tf = np.asarray(tf, dtype=np.float64)
+        lengths = np.asarray(lengths)
+        # Texts without known n-grams keep a zero embedding
+        found = lengths > 0
+        starts = (np.cumsum(lengths) - lengths)[found]
+        norms = np.sqrt(np.add.reduceat((tf * idf[cols]) ** 2, starts))
+        out[found] = np.add.reduceat(tf[:, None] * projection[cols], starts, axis=0) / norms[:, None]
+    return out[codes]
+
+
+def embed_compiled(df: pd.DataFrame, embedder: dict) -> np.ndarray:
+    """
+    Embed passenger rows with a compiled embedder; equivalent to `embed_passengers` up to float32 rounding.
+
+    Args:
+        df (pd.DataFrame): Passenger rows (not mutated)
+        embedder (dict): Output of `compile_query_embedder`
+
+    Returns:
+        np.ndarray: float32 embeddings, one row per passenger
+    """
+    # === Numeric Features ===
+    numeric = np.array(
+        [_numeric_column(df[col]) for col in embedder["numeric_features"]],
+        dtype=np.float64
+    ).T.reshape(len(df), -1)
+    numeric = np.clip(np.nan_to_num(numeric, nan=-9999), -1e5, 1e5)
+    numeric_data = (numeric - embedder["numeric_mean"]) / embedder["numeric_scale"] * NUMERIC_WEIGHT
+
+    # === Categorical Features ===
+    categorical_data = np.zeros((len(df), len(embedder["categorical_weights"])), dtype=np.float64)
+    for feature, columns in zip(embedder["categorical_features"], embedder["category_columns"]):
+        for row, value in enumerate(df[feature].to_numpy(dtype=object)):
+            col = columns.get("unknown" if value is None or pd.isna(value) else value)
+            if col is not None:
+                categorical_data[row, col] = 1.0
+    categorical_data *= embedder["categorical_weights"]
+
+    # === Text blocks ===
+    firstnames = df["firstname"].to_numpy(dtype=object)
+    surnames = df["surname"].to_numpy(dtype=object)
+    addresses = df["address"].to_numpy(dtype=object)
+    full_name = [
+        (_normalize_text(firstname) + " " + _normalize_text(surname)).strip() or "emptydoc"
+        for firstname, surname in zip(firstnames, surnames)
+    ]
+    address_block = [_normalize_text(address).strip() or "emptydoc" for address in addresses]
+
+    embeddings = np.hstack([
+        numeric_data,
+        categorical_data,
+        _embed_text(full_name, embedder["name"]),
+        _embed_text(address_block, embedder["address"]),
+    ]).astype(np.float32)
+    return np.nan_to_num(embeddings, nan=0.0)
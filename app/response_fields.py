@@ -0,0 +1,131 @@
+# app/response_fields.py
+"""
+Columns of each match in the `/combined_operation` response, and the column sets selected by the
+request's `profile` (or an explicit `fields` list).
+"""
+
+# Candidate metadata and feature columns -> response column names
+RESPONSE_RENAMES = {
+    "booking_ref": "BookingID",
+    "travel_doc": "TravelDocNumber",
+    "firstname": "Firstname",
+    "surname": "Surname",
+    "dob": "DOB",
+    "gender": "Sex",
+    "nationality": "Nationality",
+    "city": "CityName",
+    "address": "Address",
+    "departure_time": "DepartureDateTime",
+    "arrival_time": "ArrivalDateTime",
+    "departure_airport": "OriginIATA",
+    "arrival_airport": "DestinationIATA",
+    "flight_number": "FlightNumber",
+    "carrier": "OriginatorAirlineCode",
+    "dep_lat": "OriginLat",
+    "dep_lon": "OriginLon",
+    "arr_lat": "DestinationLat",
+    "arr_lon": "DestinationLon",
+    "OriginCity": "OriginCity",
+    "DestinationCity": "DestinationCity",
+    "OriginCountry": "OriginCountry",
+    "DestinationCountry": "DestinationCountry",
+    "faiss_distance": "FAISS Distance",
+    "confidence_score": "Confidence Level",
+    "FNSimilarity": "FNSimilarity",
+    "SNSimilarity": "SNSimilarity",
+    "DOBSimilarity": "DOBSimilarity",
+    "DOB1": "DOB1",
+    "DOB2": "DOB2",
+    "DOB_rarity1": "DOB_rarity1",
+    "DOB_rarity2": "DOB_rarity2",
+    "DOB_prob1": "DOB_prob1",
+    "DOB_prob2": "DOB_prob2",
+    "AgeSimilarity": "AgeSimilarity",
+    "strAddressSimilarity": "strAddressSimilarity",
+    "jcdAddressSimilarity": "jcdAddressSimilarity",
+    "cityAddressMatch": "cityAddressMatch",
+    "countryAddressMatch": "countryAddressMatch",
+    "sexMatch": "sexMatch",
+    "natMatch": "natMatch",
+    "originAirportMatch": "originAirportMatch",
+    "destinationAirportMatch": "destinationAirportMatch",
+    "orgdesAirportMatch": "orgdesAirportMatch",
+    "desorgAirportMatch": "desorgAirportMatch",
+    "originCityMatch": "originCityMatch",
+    "destinationCityMatch": "destinationCityMatch",
+    "orgdesCityMatch": "orgdesCityMatch",
+    "desorgCityMatch": "desorgCityMatch",
+    "originCountryMatch": "originCountryMatch",
+    "destinationCountryMatch": "destinationCountryMatch",
+    "orgdesCountryMatch": "orgdesCountryMatch",
+    "desorgCountryMatch": "desorgCountryMatch",
+    "originSimilarity": "originSimilarity",
+    "originExpScore": "originExpScore",
+    "destinationSimilarity": "destinationSimilarity",
+    "destinationExpScore": "destinationExpScore",
+    "orgdesSimilarity": "orgdesSimilarity",
+    "orgdesExpScore": "orgdesExpScore",
+    "desorgSimilarity": "desorgSimilarity",
+    "desorgExpScore": "desorgExpScore",
+    "Compound Similarity Score": "Compound Similarity Score",
+    "country": "Country of Address",
+}
+
+# Response columns, in response order
+RESPONSE_COLUMNS = [
+    "unique_id", "PassengerID", "PNRID", "iata_pnrgov_notif_rq_id",
+    "OriginIATA", "DestinationIATA", "FlightLegFlightNumber",  # optional alias
+    "OriginatorAirlineCode", "FlightNumber", "DepartureDateTime", "ArrivalDateTime",
+    "BookingID", "Firstname", "Surname", "FullName", "TravelDocNumber", "PlaceOfIssue",
+    "DOB", "Nationality", "Sex", "CityName", "Address",
+    "OriginLat", "OriginLon", "DestinationLat", "DestinationLon", "CityLat", "CityLon",
+    "OriginCity", "DestinationCity", "OriginCountry", "DestinationCountry", "Country of Address", "FAISS Distance",
+    "Confidence Level", "FNSimilarity", "FN1", "FN2", "FN_rarity1", "FN_rarity2", "FN_prob1", "FN_prob2",
+    "SNSimilarity", "SN1", "SN2", "SN_rarity1", "SN_rarity2", "SN_prob1", "SN_prob2",
+    "DOBSimilarity", "DOB1", "DOB2", "DOB_rarity1", "DOB_rarity2", "DOB_prob1", "DOB_prob2",
+    "AgeSimilarity", "strAddressSimilarity", "jcdAddressSimilarity", "cityAddressMatch",
+    "cityAddressRarity1", "cityAddressProb1", "cityAddressRarity2", "cityAddressProb2",
+    "countryAddressMatch", "countryAddressRarity2", "countryAddressProb2",
+    "sexMatch", "sexRarity2", "sexProb2", "natMatch", "natRarity2", "natProb2",
+    "originAirportMatch", "originAirportRarity2", "originAirportProb2",
+    "destinationAirportMatch", "destinationAirportRarity2", "destinationAirportProb2",
+    "orgdesAirportMatch", "desorgAirportMatch",
+    "originCityMatch", "originCityRarity2", "originCityProb2",
+    "destinationCityMatch", "destinationCityRarity2", "destinationCityProb2",
+    "orgdesCityMatch", "desorgCityMatch",
+    "originCountryMatch", "originCountryRarity2", "originCountryProb2",
+    "destinationCountryMatch", "destinationCountryRarity2", "destinationCountryProb2",
+    "orgdesCountryMatch", "desorgCountryMatch",
+    "originSimilarity", "originExpScore",
+    "destinationSimilarity", "destinationExpScore",
+    "orgdesSimilarity", "orgdesExpScore",
+    "desorgSimilarity", "desorgExpScore",
+    "Compound Similarity Score",
+]
+
+MINIMAL_COLUMNS = [
+    "BookingID", "Firstname", "Surname", "DOB", "Nationality", "Sex",
+    "OriginIATA", "DestinationIATA", "FlightNumber", "DepartureDateTime", "ArrivalDateTime",
+    "FAISS Distance", "Confidence Level", "Compound Similarity Score",
+]
+
+# minimal: who and which flight, with the ranking scores
+# scoring: minimal plus the features the thresholds and the compound score are computed from
+# full: every column (the historical response)
+RESPONSE_PROFILES = {
+    "minimal": MINIMAL_COLUMNS,
+    "scoring": MINIMAL_COLUMNS + [
+        "FNSimilarity", "SNSimilarity", "DOBSimilarity", "AgeSimilarity", "strAddressSimilarity",
+        "originSimilarity", "destinationSimilarity",
+    ],
+    "full": RESPONSE_COLUMNS,
+}
+DEFAULT_PROFILE = "full"
+
+
+def response_columns(data: dict) -> list:
+    """
+    Response columns for a request: its `fields` if given, otherwise its `profile`, in response order.
+    """
+    requested = set(data.get("fields") or RESPONSE_PROFILES[data.get("profile") or DEFAULT_PROFILE])
+    return [col for col in RESPONSE_COLUMNS if col in requested]
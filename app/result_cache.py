@@ -0,0 +1,185 @@
+# app/result_cache.py
+"""
+Cache of scored search candidates.
+
+A search's candidates only depend on the query fields, the arrival window, the search spec and the
+shards searched, not on `nameThreshold`/`ageThreshold` or the response columns. The merged
+candidates are cached together with their threshold features (name and age similarity), so a rerun
+with other thresholds or another profile skips embedding, FAISS search and threshold scoring and
+only re-filters. Keys carry the version of every shard bundle searched (see
+`model_cache.loaded_versions`), so once a rebuilt shard is reloaded its old entries are unreachable;
+they expire after the TTL.
+
+Entries are Arrow IPC frames stored in Redis when RESULT_CACHE_URL is set. When Redis is not
+configured or not reachable, entries go to a bounded in-process LRU instead, and Redis is retried
+after `retry_interval` seconds.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import orjson
+import pandas as pd
+import pyarrow as pa
+import redis
+
+from app.config import RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_CACHE_URL
+from app.serialization import frame_from_ipc, frame_to_ipc
+
+KEY_PREFIX = "candidates:"
+
+# Query fields the search and the threshold features treat case-insensitively
+CASE_INSENSITIVE_FIELDS = ["firstname", "surname", "address"]
+
+
+def candidate_cache_key(query: dict, search_spec: dict, max_candidates: int, shard_versions: Dict[str, Optional[str]]) -> str:
+    """
+    Cache key of a search's candidates: a digest of the normalized query, the arrival window, the
+    search spec, the candidate cap and the version of each shard searched.
+    """
+    normalized = {
+        field: value.lower() if field in CASE_INSENSITIVE_FIELDS and isinstance(value, str) else value
+        for field, value in query.items()
+    }
+    inputs = {
+        "query": normalized,
+        "arrival_date_from": search_spec["arrival_date_from"],
+        "arrival_date_to": search_spec["arrival_date_to"],
+        "equals": search_spec["equals"],
+        "top_k": search_spec["top_k"],
+        "nprobe": search_spec["nprobe"],
+        "max_candidates": max_candidates,
+        "shards": shard_versions,
+    }
+    digest = hashlib.sha256(orjson.dumps(inputs, option=orjson.OPT_SORT_KEYS, default=str)).hexdigest()
+    return KEY_PREFIX + digest
+
+
+class ResultCache:
+    """
+    Byte-string cache with a TTL: Redis when configured and reachable, otherwise a bounded,
+    thread-safe in-process LRU.
+    """
+
+    def __init__(self, url: str, ttl: int, maxsize: int, retry_interval: float = 30.0):
+        self.url = url
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.retry_interval = retry_interval
+        self._redis = None
+        self._redis_down_until = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _client(self) -> Optional[redis.Redis]:
+        if not self.url or time.monotonic() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.url, socket_connect_timeout=0.5, socket_timeout=1.0)
+        return self._redis
+
+    def _redis_failed(self, e: Exception):
+        self.redis_errors += 1
+        self._redis_down_until = time.monotonic() + self.retry_interval
+        logging.warning(f"Result cache Redis unavailable, using the local cache for {self.retry_interval:.0f} seconds: {e}")
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = None
+        client = self._client()
+        if client is not None:
+            try:
+                value = client.get(key)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+                value = self._local_get(key)
+        else:
+            value = self._local_get(key)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes):
+        client = self._client()
+        if client is not None:
+            try:
+                client.set(key, value, ex=self.ttl)
+                return
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        self._local_put(key, value)
+
+    def _local_get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if time.monotonic() >= expires:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _local_put(self, key: str, value: bytes):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "redis" if self._client() is not None else "local",
+                "ttl": self.ttl,
+                "local_size": len(self._entries),
+                "local_max_size": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "redis_errors": self.redis_errors,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_result_cache = ResultCache(RESULT_CACHE_URL, RESULT_CACHE_TTL, RESULT_CACHE_SIZE)
+
+
+def result_cache_enabled() -> bool:
+    return _result_cache.enabled
+
+
+def get_cached_candidates(key: str) -> Optional[pd.DataFrame]:
+    payload = _result_cache.get(key)
+    return None if payload is None else frame_from_ipc(payload)
+
+
+def cache_candidates(key: str, candidates: pd.DataFrame):
+    try:
+        payload = frame_to_ipc(candidates)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        logging.warning(f"Not caching candidates that cannot be encoded: {e}")
+        return
+    _result_cache.put(key, payload)
+
+
+def result_cache_stats() -> dict:
+    return _result_cache.stats()
@@ -3,9 +3,12 @@ from datetime import date
 from typing import Optional, Literal
 
 from pydantic import BaseModel, Field, model_validator, field_validator
-from typing import Optional
+from typing import Optional, List
 from datetime import date, datetime
 
+from app.config import DEFAULT_TOP_K, MAX_BATCH_QUERIES, MAX_CANDIDATES, MAX_NPROBE, MAX_TOP_K
+from app.response_fields import DEFAULT_PROFILE, RESPONSE_COLUMNS
+
 class FlightSearchRequest(BaseModel):
     arrival_date_from: Optional[datetime]
     arrival_date_to: Optional[datetime]
@@ -45,6 +48,42 @@ class CombinedRequest(BaseModel):
     nameThreshold: Optional[float] = 0.0
     ageThreshold: Optional[float] = 0.0
     locationThreshold: Optional[float] = 0.0
+    top_k: Optional[int] = Field(
+        default=DEFAULT_TOP_K,
+        ge=1,
+        le=MAX_TOP_K,
+        description="Nearest neighbours retrieved from each shard."
+    )
+    nprobe: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=MAX_NPROBE,
+        description="IVF lists probed per shard. Defaults to the index setting."
+    )
+    min_results: Optional[int] = Field(
+        default=0,
+        ge=0,
+        description="If fewer matches survive the filters, k and nprobe are doubled and the search repeated, up to a cap."
+    )
+    max_candidates: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=MAX_CANDIDATES,
+        description="Closest candidates across all shards passed on to scoring. Defaults to MAX_CANDIDATES."
+    )
+    strict_filters: Optional[List[Literal["sex", "nationality"]]] = Field(
+        default=None,
+        description="Fields candidates must match exactly. Applied inside the FAISS search, before ranking."
+    )
+    profile: Optional[Literal["minimal", "scoring", "full"]] = Field(
+        default=DEFAULT_PROFILE,
+        description="Columns returned per match: 'minimal' (identity, flight and ranking scores), 'scoring' (plus the threshold and compound score features) or 'full'."
+    )
+    fields: Optional[List[str]] = Field(
+        default=None,
+        min_length=1,
+        description="Exact response columns to return, in response order. Overrides `profile`."
+    )
 
     @field_validator("dob", mode="before")
     @classmethod
@@ -57,6 +96,14 @@ class CombinedRequest(BaseModel):
             raise ValueError("`dob` must be in 'YYYY-MM-DD' format. You may enter an approximate date.")
         return v
 
+    @field_validator("fields")
+    @classmethod
+    def validate_fields(cls, v):
+        unknown = [field for field in v or [] if field not in RESPONSE_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown response fields: {', '.join(unknown)}")
+        return v
+
     @field_validator("sex", mode="before")
     @classmethod
     def normalize_and_validate_sex(cls, v):
@@ -87,3 +134,12 @@ class CombinedRequest(BaseModel):
             raise ValueError(" | ".join(errors))
 
         return self
+
+
+class BatchCombinedRequest(BaseModel):
+    queries: List[CombinedRequest] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BATCH_QUERIES,
+        description="Query profiles to screen in one request. Each entry follows the `/combined_operation` body."
+    )
@@ -0,0 +1,98 @@
+# app/score_memo.py
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app.config import SCORE_MEMO_SIZE
+
+_MISS = object()
+
+
+class ScoreMemo:
+    """
+    Bounded, thread-safe LRU memo of feature scores keyed by (namespace, candidate value), where the
+    namespace identifies the scorer and the query value. Shared by all requests in the process, so hot
+    (query value, candidate value) pairs are scored once.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, namespace, values) -> list:
+        with self._lock:
+            found = []
+            for value in values:
+                score = self._entries.get((namespace, value), _MISS)
+                if score is _MISS:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end((namespace, value))
+                found.append(score)
+            return found
+
+    def put_many(self, namespace, values, scores):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            for value, score in zip(values, scores):
+                self._entries[(namespace, value)] = score
+                self._entries.move_to_end((namespace, value))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_score_memo = ScoreMemo(SCORE_MEMO_SIZE)
+
+
+def score_distinct(values, scorer, missing=np.nan, memo_namespace=None) -> np.ndarray:
+    """
+    Score each distinct value of a candidate column once and broadcast the scores back to the rows.
+
+    Args:
+        values (array-like): Candidate column
+        scorer (callable): Maps a Series of distinct, non-missing values to an array of scores
+        missing: Score for missing (NA) rows
+        memo_namespace (hashable): When given, scores are memoized across requests under this
+            namespace; it must identify the scorer and the query value
+
+    Returns:
+        np.ndarray: One score per row of `values`
+    """
+    codes, uniques = pd.factorize(pd.Series(values))
+    uniques = pd.Series(uniques)
+
+    if memo_namespace is None:
+        unique_scores = np.asarray(scorer(uniques)) if len(uniques) else np.empty(0)
+    else:
+        cached = _score_memo.get_many(memo_namespace, uniques.tolist())
+        todo = [i for i, score in enumerate(cached) if score is _MISS]
+        if todo:
+            computed = np.asarray(scorer(uniques.iloc[todo].reset_index(drop=True)))
+            _score_memo.put_many(memo_namespace, uniques.iloc[todo].tolist(), computed.tolist())
+            for i, score in zip(todo, computed.tolist()):
+                cached[i] = score
+        unique_scores = np.asarray(cached)
+
+    if (codes < 0).any():
+        # codes of -1 pick the appended missing score
+        unique_scores = np.append(unique_scores, missing)
+    return unique_scores[codes]
+
+
+def score_memo_stats() -> dict:
+    return _score_memo.stats()
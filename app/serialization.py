@@ -0,0 +1,190 @@
+# app/serialization.py
+"""
+Response encoding for the search endpoints, chosen by the request's Accept header.
+
+JSON is written with orjson straight from the pipeline result: the result frames are turned into
+records and NumPy scalars and Timestamps are encoded natively, without FastAPI's
+`jsonable_encoder` walk. Bulk analytics clients can instead ask for the matches as an Arrow IPC
+stream (`application/vnd.apache.arrow.stream`) or a Parquet file (`application/vnd.apache.parquet`);
+those are built column by column from the result frame, and the rest of the result (status,
+message, search summary) is carried as JSON in the schema metadata under `result`.
+"""
+import base64
+import io
+from typing import Optional
+
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.responses import Response
+
+JSON = "application/json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+PARQUET_ALIASES = (PARQUET, "application/x-parquet")
+NDJSON = "application/x-ndjson"
+EVENT_STREAM = "text/event-stream"
+
+# Column identifying the query of each match in batch Arrow/Parquet output
+BATCH_QUERY_COLUMN = "QueryIndex"
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """
+    Response media type for an Accept header: Arrow or Parquet when the client lists them, JSON otherwise.
+    """
+    accept = (accept or "").lower()
+    if ARROW_STREAM in accept:
+        return ARROW_STREAM
+    if any(media_type in accept for media_type in PARQUET_ALIASES):
+        return PARQUET
+    return JSON
+
+
+def frame_records(frame: pd.DataFrame) -> list:
+    """
+    `frame.to_dict(orient="records")`, built from whole columns: values become Python scalars in
+    one `tolist` per column and timestamps become `datetime`, which orjson encodes natively.
+    """
+    columns = []
+    for col in frame.columns:
+        values = frame[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            columns.append(list(values.dt.to_pydatetime()))
+        else:
+            columns.append(values.tolist())
+    names = [str(col) for col in frame.columns]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def _default(value):
+    if isinstance(value, pd.DataFrame):
+        return frame_records(value)
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if value is pd.NaT:
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def stream_media_type(accept: Optional[str]) -> str:
+    """
+    Media type of a streamed response: server-sent events when the client lists them, NDJSON otherwise.
+    """
+    return EVENT_STREAM if EVENT_STREAM in (accept or "").lower() else NDJSON
+
+
+async def encode_stream(records, media_type: str):
+    """
+    Encode an async iterator of result records as NDJSON lines or server-sent events, one record
+    per line/event.
+    """
+    async for record in records:
+        if media_type == EVENT_STREAM:
+            yield b"event: " + record["record"].encode() + b"\ndata: " + dumps(record) + b"\n\n"
+        else:
+            yield dumps(record) + b"\n"
+
+
+def _arrow_column(values: pd.Series) -> pa.Array:
+    try:
+        return pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object column (e.g. strings with 0 for missing values): send it as text
+        return pa.array(values.map(lambda value: None if pd.isna(value) else str(value)), type=pa.string())
+
+
+def frame_to_table(frame: pd.DataFrame, result: dict) -> pa.Table:
+    """
+    The result frame as an Arrow table; numeric columns are wrapped without copying.
+    """
+    table = pa.Table.from_arrays(
+        [_arrow_column(frame[col]) for col in frame.columns],
+        names=[str(col) for col in frame.columns],
+    )
+    summary = {key: value for key, value in result.items() if key not in ("data", "results")}
+    return table.replace_schema_metadata({"result": dumps(summary)})
+
+
+def _as_frame(data) -> pd.DataFrame:
+    return data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+
+
+def batch_frame(result: dict) -> pd.DataFrame:
+    """
+    Matches of all batch queries in one frame, tagged with the query's position in the request.
+    """
+    frames = []
+    for position, query_result in enumerate(result["results"]):
+        frame = _as_frame(query_result["data"])
+        frames.append(frame.assign(**{BATCH_QUERY_COLUMN: position})[[BATCH_QUERY_COLUMN, *frame.columns]])
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=[BATCH_QUERY_COLUMN])
+
+
+def frame_to_ipc(frame: pd.DataFrame) -> bytes:
+    """
+    A DataFrame as Arrow IPC stream bytes, with its dtypes (categoricals, timestamps) intact.
+    """
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def frame_from_ipc(payload: bytes) -> pd.DataFrame:
+    return pa.ipc.open_stream(payload).read_all().to_pandas()
+
+
+def encode_frame(frame: pd.DataFrame) -> str:
+    """
+    A DataFrame as a base64 Arrow IPC stream, to pass through JSON-only channels (Celery results)
+    with its dtypes intact.
+    """
+    return base64.b64encode(frame_to_ipc(frame)).decode("ascii")
+
+
+def decode_frame(payload: str) -> pd.DataFrame:
+    return frame_from_ipc(base64.b64decode(payload))
+
+
+def _binary_response(table: pa.Table, media_type: str) -> Response:
+    sink = io.BytesIO()
+    if media_type == ARROW_STREAM:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink)
+    return Response(content=sink.getvalue(), media_type=media_type)
+
+
+def encode_result(result: dict, accept: Optional[str]) -> Response:
+    """
+    Encode a `run_similarity_pipeline` result (with `data` as a frame or records) for the client.
+    """
+    media_type = negotiate_format(accept)
+    if media_type == JSON:
+        return Response(content=dumps(result), media_type=JSON)
+    return _binary_response(frame_to_table(_as_frame(result["data"]), result), media_type)
+
+
+def encode_batch_result(result: dict, accept: Optional[str]) -> Response:
+    """
+    Encode a `run_batch_similarity_pipeline` result. Arrow and Parquet carry all queries' matches in
+    one table with a `QueryIndex` column, and the per-query summaries in the metadata.
+    """
+    media_type = negotiate_format(accept)
+    if media_type == JSON:
+        return Response(content=dumps(result), media_type=JSON)
+    summary = dict(result, queries=[
+        {key: value for key, value in query_result.items() if key != "data"} for query_result in result["results"]
+    ])
+    return _binary_response(frame_to_table(batch_frame(result), summary), media_type)
@@ -0,0 +1,318 @@
+# app/shard_bundle.py
+"""
+Consolidated, memory-mappable shard bundle format.
+
+A bundle is one directory per shard (`model/shard_<label>/`):
+
+    manifest.json        format version, shard label, row count, per-file size + sha256, bundle checksum,
+                         and the small lookup tables (feature names, categories, filter values)
+    index.faiss          FAISS index, opened with IO_FLAG_MMAP
+    metadata.feather     uncompressed Arrow IPC file, memory-mapped as a pyarrow Table, with derived
+                         columns materialized (see `derive_metadata_columns`) and low-cardinality
+                         columns dictionary-encoded
+    departure_ts.npy     row filters (datetime64[ns]) ...
+    arrival_ts.npy
+    filter_<col>.npy     ... and factorized codes of each structured filter column
+    embedder_*.npy       precompiled query embedder arrays (see query_embedder.py); absent when the
+                         shard uses the shared ('global') embedding
+
+Every array is opened with `np.load(mmap_mode="r")`, so a cold load only reads the manifest and
+page tables, and the OS page cache is shared by every process serving the same shard.
+
+This module only depends on numpy/pandas/pyarrow/faiss so the training scripts can import it too.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+import faiss
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+_EMBEDDER_ARRAYS = ["numeric_mean", "numeric_scale", "categorical_weights"]
+_TEXT_BLOCKS = ["name", "address"]
+
+# Low-cardinality metadata columns stored dictionary-encoded
+DICTIONARY_COLUMNS = [
+    "departure_airport", "arrival_airport", "nationality", "gender", "carrier",
+    "OriginCity", "DestinationCity", "OriginCountry", "DestinationCountry",
+]
+
+
+def bundle_dir(model_dir: str, shard_label: str) -> str:
+    return os.path.join(model_dir, f"shard_{shard_label}")
+
+
+def build_filter_codes(metadata: pd.DataFrame, filter_columns) -> dict:
+    """
+    Map each of `filter_columns` present in `metadata` to (codes, {normalized value: code}); values
+    are compared stripped and lowercased, missing values get code -1.
+    """
+    filter_codes = {}
+    for col in filter_columns:
+        if col in metadata.columns:
+            codes, uniques = pd.factorize(metadata[col].astype("string").str.strip().str.lower())
+            filter_codes[col] = (codes, {value: code for code, value in enumerate(uniques)})
+    return filter_codes
+
+
+def build_row_filters(metadata: pd.DataFrame, filter_columns) -> dict:
+    """
+    Per-row arrays used to push structured filters down into the FAISS search.
+
+    Returns:
+        dict: 'departure_ts'/'arrival_ts' as datetime64[ns] arrays (NaT when unparseable) and
+        'filter_codes' (see `build_filter_codes`).
+    """
+    return {
+        "departure_ts": pd.to_datetime(metadata["departure_time"], errors="coerce").to_numpy("datetime64[ns]"),
+        "arrival_ts": pd.to_datetime(metadata["arrival_time"], errors="coerce").to_numpy("datetime64[ns]"),
+        "filter_codes": build_filter_codes(metadata, filter_columns),
+    }
+
+
+def derive_metadata_columns(metadata: pd.DataFrame, geo=None) -> pd.DataFrame:
+    """
+    Materialize the columns the feature engine would otherwise derive on every request.
+
+    - departure_time/arrival_time parsed to datetime64 (NaT when unparseable)
+    - firstname_norm/surname_norm: lowercased names (None where the name is not a string)
+    - dob_day: date of birth as int32 days since 1970-01-01 (null when missing or unparseable)
+    - OriginCity/DestinationCity/OriginCountry/DestinationCountry resolved from the IATA codes,
+      when `geo` (a LocDataAccess) is given
+    - DICTIONARY_COLUMNS as categoricals, stored dictionary-encoded
+
+    Args:
+        metadata (pd.DataFrame): Shard metadata (not mutated)
+        geo: Object with `cities_by_iata`/`countries_by_iata` bulk resolvers
+
+    Returns:
+        pd.DataFrame: Metadata with the derived columns
+    """
+    metadata = metadata.copy()
+    for col in ("departure_time", "arrival_time"):
+        metadata[col] = pd.to_datetime(metadata[col], errors="coerce")
+    for col in ("firstname", "surname"):
+        names = metadata[col]
+        metadata[f"{col}_norm"] = names.where(names.map(lambda value: isinstance(value, str))).str.lower()
+    dob = pd.to_datetime(metadata["dob"], errors="coerce").dt.normalize()
+    metadata["dob_day"] = (dob - pd.Timestamp("1970-01-01")).dt.days.astype("Int32")
+    if geo is not None:
+        metadata["OriginCity"] = geo.cities_by_iata(metadata["departure_airport"])
+        metadata["DestinationCity"] = geo.cities_by_iata(metadata["arrival_airport"])
+        metadata["OriginCountry"] = geo.countries_by_iata(metadata["departure_airport"])
+        metadata["DestinationCountry"] = geo.countries_by_iata(metadata["arrival_airport"])
+    for col in DICTIONARY_COLUMNS:
+        if col in metadata.columns:
+            metadata[col] = metadata[col].astype("category")
+    return metadata
+
+
+def decode_dictionaries(table: pa.Table) -> pa.Table:
+    """
+    Cast dictionary-encoded columns back to their value type, so `to_pandas` yields the plain
+    object columns the scoring code expects instead of categoricals.
+    """
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+    return table
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _bundle_checksum(files: dict) -> str:
+    return hashlib.sha256(
+        "".join(f"{name}:{files[name]['sha256']};" for name in sorted(files)).encode()
+    ).hexdigest()
+
+
+def write_bundle(out_dir: str, shard_label: str, index=None, metadata=None, embedder=None, filter_columns=(), geo=None) -> dict:
+    """
+    Write a shard bundle directory, replacing any previous bundle at `out_dir` only once it is complete.
+
+    Args:
+        out_dir (str): Bundle directory (see `bundle_dir`)
+        shard_label (str): Shard label recorded in the manifest
+        index (faiss.Index): FAISS index, row-aligned with `metadata` (optional for an embedder-only bundle)
+        metadata (pd.DataFrame): Passenger metadata
+        embedder (dict): Compiled query embedder, or None for shards that use the shared embedding
+        filter_columns: Metadata columns to precompute structured filter codes for
+        geo: LocDataAccess used to materialize the airport city/country columns (see `derive_metadata_columns`)
+
+    Returns:
+        dict: The manifest
+    """
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    manifest = {"format_version": BUNDLE_FORMAT_VERSION, "shard_label": shard_label, "created_at": time.time()}
+
+    if index is not None:
+        faiss.write_index(index, os.path.join(tmp_dir, "index.faiss"))
+    if metadata is not None:
+        manifest["rows"] = len(metadata)
+        metadata = derive_metadata_columns(metadata, geo)
+        table = pa.Table.from_pandas(metadata, preserve_index=False)
+        feather.write_feather(table, os.path.join(tmp_dir, "metadata.feather"), compression="uncompressed")
+        row_filters = build_row_filters(metadata, filter_columns)
+        np.save(os.path.join(tmp_dir, "departure_ts.npy"), row_filters["departure_ts"])
+        np.save(os.path.join(tmp_dir, "arrival_ts.npy"), row_filters["arrival_ts"])
+        manifest["filters"] = {}
+        for col, (codes, code_of) in row_filters["filter_codes"].items():
+            np.save(os.path.join(tmp_dir, f"filter_{col}.npy"), codes)
+            manifest["filters"][col] = list(code_of)
+    if embedder is not None:
+        for name in _EMBEDDER_ARRAYS:
+            np.save(os.path.join(tmp_dir, f"embedder_{name}.npy"), embedder[name])
+        for block in _TEXT_BLOCKS:
+            vocabulary = sorted(embedder[block]["vocabulary"], key=embedder[block]["vocabulary"].get)
+            np.save(os.path.join(tmp_dir, f"embedder_{block}_vocabulary.npy"), np.array(vocabulary, dtype=str))
+            np.save(os.path.join(tmp_dir, f"embedder_{block}_idf.npy"), embedder[block]["idf"])
+            np.save(os.path.join(tmp_dir, f"embedder_{block}_projection.npy"), embedder[block]["projection"])
+        manifest["embedder"] = {
+            "numeric_features": embedder["numeric_features"],
+            "categorical_features": embedder["categorical_features"],
+            "categories": [sorted(columns, key=columns.get) for columns in embedder["category_columns"]],
+            "ngram_range": {block: list(embedder[block]["ngram_range"]) for block in _TEXT_BLOCKS},
+        }
+
+    manifest["files"] = {
+        name: {"bytes": os.path.getsize(os.path.join(tmp_dir, name)), "sha256": _sha256(os.path.join(tmp_dir, name))}
+        for name in sorted(os.listdir(tmp_dir))
+    }
+    manifest["checksum"] = _bundle_checksum(manifest["files"])
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    old_dir = out_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logging.info(f"Wrote shard bundle {out_dir} ({sum(f['bytes'] for f in manifest['files'].values()) / 2**20:.1f} MiB)")
+    return manifest
+
+
+def read_manifest(path: str) -> dict:
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported shard bundle format {manifest.get('format_version')} in {path}")
+    return manifest
+
+
+def verify_bundle(path: str, full: bool = True) -> dict:
+    """
+    Check a bundle against its manifest: every file present with the recorded size and, when
+    `full`, the recorded sha256. Raises ValueError on any mismatch.
+    """
+    manifest = read_manifest(path)
+    for name, expected in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path) or os.path.getsize(file_path) != expected["bytes"]:
+            raise ValueError(f"Shard bundle {path}: {name} is missing or truncated")
+        if full and _sha256(file_path) != expected["sha256"]:
+            raise ValueError(f"Shard bundle {path}: checksum mismatch for {name}")
+    if _bundle_checksum(manifest["files"]) != manifest["checksum"]:
+        raise ValueError(f"Shard bundle {path}: manifest checksum mismatch")
+    return manifest
+
+
+def _read_embedder(path: str, spec: dict) -> dict:
+    def array(name):
+        return np.load(os.path.join(path, f"embedder_{name}.npy"), mmap_mode="r")
+
+    embedder = {name: array(name) for name in _EMBEDDER_ARRAYS}
+    embedder["numeric_features"] = spec["numeric_features"]
+    embedder["categorical_features"] = spec["categorical_features"]
+    embedder["category_columns"] = []
+    offset = 0
+    for categories in spec["categories"]:
+        embedder["category_columns"].append({value: offset + col for col, value in enumerate(categories)})
+        offset += len(categories)
+    for block in _TEXT_BLOCKS:
+        embedder[block] = {
+            "vocabulary": {ngram: col for col, ngram in enumerate(array(f"{block}_vocabulary").tolist())},
+            "ngram_range": tuple(spec["ngram_range"][block]),
+            "idf": array(f"{block}_idf"),
+            "projection": array(f"{block}_projection"),
+        }
+    return embedder
+
+
+def read_bundle(path: str, verify: bool = False) -> dict:
+    """
+    Open a shard bundle with everything memory-mapped.
+
+    The manifest and file sizes are always checked; `verify` also re-hashes every file.
+
+    Returns:
+        dict: 'index', 'metadata' (pyarrow Table), 'departure_ts', 'arrival_ts', 'filter_codes' and
+        'embedder' for the parts the bundle holds, plus 'version' (the bundle checksum),
+        'manifest' and 'nbytes' (total file size)
+    """
+    manifest = verify_bundle(path, full=verify)
+    files = manifest["files"]
+    bundle = {
+        "version": manifest["checksum"],
+        "manifest": manifest,
+        "nbytes": sum(f["bytes"] for f in files.values()),
+    }
+    if "index.faiss" in files:
+        bundle["index"] = faiss.read_index(os.path.join(path, "index.faiss"), faiss.IO_FLAG_MMAP)
+    if "metadata.feather" in files:
+        bundle["metadata"] = pa.ipc.open_file(pa.memory_map(os.path.join(path, "metadata.feather"), "r")).read_all()
+        bundle["departure_ts"] = np.load(os.path.join(path, "departure_ts.npy"), mmap_mode="r")
+        bundle["arrival_ts"] = np.load(os.path.join(path, "arrival_ts.npy"), mmap_mode="r")
+        bundle["filter_codes"] = {
+            col: (
+                np.load(os.path.join(path, f"filter_{col}.npy"), mmap_mode="r"),
+                {value: code for code, value in enumerate(values)},
+            )
+            for col, values in manifest.get("filters", {}).items()
+        }
+    if "embedder" in manifest:
+        bundle["embedder"] = _read_embedder(path, manifest["embedder"])
+    return bundle
+
+
+def convert_legacy_shard(model_dir: str, shard_label: str, filter_columns=(), compile_embedder=None, geo=None) -> dict:
+    """
+    Write the bundle directory for a shard stored in the legacy layout (six joblib pickles,
+    `faiss_IVF_<label>.index` and `metadata_<label>.parquet`; any of them may be missing, e.g.
+    the shared bundle only has pickles and shards on the shared embedding have no pickles).
+
+    Args:
+        compile_embedder: `query_embedder.compile_query_embedder`, used when no `embedder_<label>.pkl` was exported
+        geo: LocDataAccess for the derived airport columns
+    """
+    import joblib
+
+    def legacy(name, ext="pkl"):
+        path = os.path.join(model_dir, f"{name}_{shard_label}.{ext}")
+        return path if os.path.exists(path) else None
+
+    embedder = None
+    if legacy("embedder"):
+        embedder = joblib.load(legacy("embedder"))
+    elif legacy("encoder") and compile_embedder is not None:
+        names = ["encoder", "scaler", "tfidf_name", "tfidf_addr", "svd_name", "svd_addr"]
+        embedder = compile_embedder({name: joblib.load(legacy(name)) for name in names})
+    index = faiss.read_index(legacy("faiss_IVF", "index")) if legacy("faiss_IVF", "index") else None
+    metadata = pd.read_parquet(legacy("metadata", "parquet")) if legacy("metadata", "parquet") else None
+    return write_bundle(bundle_dir(model_dir, shard_label), shard_label, index, metadata, embedder, filter_columns, geo)
@@ -0,0 +1,63 @@
+# app/shard_routing.py
+"""
+Shard-affinity routing for the Celery per-shard subtasks.
+
+Each shard label has its own queue. Workers list the shards they own in WORKER_SHARDS, consume
+only those shard queues (plus the default queue for merge callbacks and whole-pipeline tasks) and
+preload the shards at boot, so every shard is searched by a worker that already has it in memory
+and a worker's bundle cache only ever holds its own shards. Only shards known to have an owner
+(AFFINITY_SHARDS, plus this process's own WORKER_SHARDS) are routed to their queue; a subtask sent
+to a queue nobody consumes would leave its job pending forever, so other shards use the default queue.
+"""
+import logging
+import time
+from typing import List, Optional
+
+from app.config import AFFINITY_SHARDS, SHARD_AFFINITY, SHARD_QUEUE_PREFIX, WORKER_SHARDS
+from app.model_cache import load_model_bundle
+
+SHARD_TASKS = {"search_shard_task"}
+OWNED_SHARDS = frozenset(AFFINITY_SHARDS) | frozenset(WORKER_SHARDS)
+
+_unowned_warned = set()
+
+
+def shard_queue(shard_label: str) -> str:
+    return f"{SHARD_QUEUE_PREFIX}{shard_label}"
+
+
+def route_shard_task(name, args, kwargs, options, task=None, **kw) -> Optional[dict]:
+    """
+    Celery task router: per-shard subtasks of owned shards go to their shard's queue when
+    SHARD_AFFINITY is on. Other tasks, subtasks of shards without an owner, and all tasks with
+    affinity off keep the default routing.
+    """
+    if not SHARD_AFFINITY or name not in SHARD_TASKS:
+        return None
+    shard_label = kwargs["shard_label"] if "shard_label" in kwargs else args[1]
+    if shard_label not in OWNED_SHARDS:
+        if shard_label not in _unowned_warned:
+            _unowned_warned.add(shard_label)
+            logging.warning(f"Shard {shard_label} is not in AFFINITY_SHARDS, sending its subtasks to the default queue")
+        return None
+    return {"queue": shard_queue(shard_label)}
+
+
+def owned_shard_queues(shard_labels: List[str] = WORKER_SHARDS) -> List[str]:
+    return [shard_queue(shard_label) for shard_label in shard_labels]
+
+
+def preload_shards(shard_labels: List[str] = WORKER_SHARDS) -> None:
+    """
+    Load the owned shards into this process's bundle cache. Workers call it in the main process
+    before the pool starts, so prefork children inherit the loaded bundles (shared copy-on-write)
+    instead of each loading its own copy.
+    """
+    for shard_label in shard_labels:
+        start = time.time()
+        try:
+            load_model_bundle(shard_label)
+        except Exception as e:
+            logging.error(f"Could not preload shard {shard_label}: {e}")
+            continue
+        logging.info(f"Preloaded shard {shard_label} in {time.time() - start:.2f} seconds")
@@ -0,0 +1,260 @@
+# app/shard_search.py
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.config import DEFAULT_TOP_K, RESULT_METADATA_COLUMNS, SHARD_SEARCH_WORKERS
+from app.embedding import embed_passengers
+from app.faiss_search import faiss_search_batch_with_metadata, index_probes, metadata_columns
+from app.model_cache import load_model_bundle, load_shared_preprocessors
+from app.query_embedder import embed_compiled
+
+
+def shard_row_mask(models: dict, search_spec: Optional[dict]) -> Optional[np.ndarray]:
+    """
+    Boolean mask of the shard rows that satisfy a search spec's filters, or None when nothing is filtered.
+
+    Args:
+        models (dict): Shard bundle from `load_model_bundle`
+        search_spec (dict): Per-query search spec. Filters are the optional 'arrival_date_from'/
+            'arrival_date_to' bounds (departure on or after the start, arrival on or before the end) and
+            'equals', a {metadata column: value} dict of exact (case-insensitive) matches. 'top_k' and
+            'nprobe' set the neighbours per shard and the IVF lists probed.
+
+    Returns:
+        Optional[np.ndarray]: Rows to search
+    """
+    if not search_spec:
+        return None
+
+    mask = np.ones(models["index"].ntotal, dtype=bool)
+    if search_spec.get("arrival_date_from") is not None:
+        mask &= models["departure_ts"] >= pd.Timestamp(search_spec["arrival_date_from"]).to_datetime64()
+    if search_spec.get("arrival_date_to") is not None:
+        mask &= models["arrival_ts"] <= pd.Timestamp(search_spec["arrival_date_to"]).to_datetime64()
+    for col, value in search_spec.get("equals", {}).items():
+        codes, code_of = models["filter_codes"][col]
+        code = code_of.get(str(value).strip().lower())
+        if code is None:
+            return np.zeros_like(mask)
+        mask &= codes == code
+    return mask
+
+
+def _search_spec_key(search_spec: Optional[dict]):
+    if not search_spec:
+        return None
+    return (
+        search_spec.get("arrival_date_from"),
+        search_spec.get("arrival_date_to"),
+        tuple(sorted(search_spec.get("equals", {}).items())),
+        search_spec.get("top_k"),
+        search_spec.get("nprobe"),
+    )
+
+
+def shard_probes(shard_labels: List[str]) -> Optional[Tuple[int, int]]:
+    """
+    The largest default nprobe and nlist of the shards' IVF indexes, or None when none of them is IVF.
+    """
+    probes = [index_probes(load_model_bundle(shard_label)["index"]) for shard_label in shard_labels]
+    probes = [value for value in probes if value is not None]
+    if not probes:
+        return None
+    return max(nprobe for nprobe, _ in probes), max(nlist for _, nlist in probes)
+
+
+def embed_queries(query_df: pd.DataFrame, preprocessors: dict) -> np.ndarray:
+    if preprocessors.get("embedder") is not None:
+        return embed_compiled(query_df, preprocessors["embedder"])
+
+    # embed_passengers normalizes text columns in place, so it gets its own copy
+    embeddings, *_ = embed_passengers(
+        query_df.copy(),
+        preprocessors["encoder"],
+        preprocessors["scaler"],
+        preprocessors["tfidf_name"],
+        preprocessors["tfidf_addr"],
+        preprocessors["svd_name"],
+        preprocessors["svd_addr"]
+    )
+    return np.nan_to_num(embeddings.astype("float32"))
+
+
+def shared_query_embeddings(query_df: pd.DataFrame) -> Optional[np.ndarray]:
+    """
+    Embed the query rows once with the shared preprocessors, or None when there is no shared bundle.
+    """
+    shared = load_shared_preprocessors()
+    return None if shared is None else embed_queries(query_df, shared)
+
+
+def search_shard_batch(
+    shard_label: str,
+    query_df: pd.DataFrame,
+    search_specs: Optional[List[Optional[dict]]] = None,
+    shared_embeddings: Optional[np.ndarray] = None
+) -> List[pd.DataFrame]:
+    """
+    Load a shard bundle, embed all query rows in one call and run one multi-row FAISS search
+    per distinct search spec.
+
+    Args:
+        shard_label (str): Shard label (e.g. "2019-01-01_2019-02-28")
+        query_df (pd.DataFrame): Enriched query rows (not mutated)
+        search_specs (List[dict]): Optional search spec per query row (see `shard_row_mask`); its
+            filters are pushed down into the FAISS search so all k neighbours satisfy them
+        shared_embeddings (np.ndarray): Query rows already embedded with the shared preprocessors
+            (see `shared_query_embeddings`); used instead of re-embedding when the shard shares them
+
+    Returns:
+        List[pd.DataFrame]: Matched passengers for this shard, one frame per query row
+    """
+    models = load_model_bundle(shard_label)
+
+    if shared_embeddings is not None and models["shared_embedding"]:
+        embeddings = shared_embeddings
+    else:
+        embeddings = embed_queries(query_df, models)
+
+    metadata = models["metadata"]
+    available = set(metadata_columns(metadata))
+    columns = [col for col in RESULT_METADATA_COLUMNS if col in available]
+    search_specs = search_specs or [None] * len(embeddings)
+
+    # Rows sharing a spec share one search
+    groups = {}
+    for row, search_spec in enumerate(search_specs):
+        groups.setdefault(_search_spec_key(search_spec), []).append(row)
+
+    results = [None] * len(embeddings)
+    for rows in groups.values():
+        search_spec = search_specs[rows[0]] or {}
+        matches = faiss_search_batch_with_metadata(
+            embeddings[rows],
+            models["index"],
+            metadata,
+            top_k=search_spec.get("top_k") or DEFAULT_TOP_K,
+            columns=columns,
+            row_mask=shard_row_mask(models, search_spec),
+            nprobe=search_spec.get("nprobe")
+        )
+        for row, row_matches in zip(rows, matches):
+            results[row] = row_matches
+    return results
+
+
+def search_shard(
+    shard_label: str,
+    query_df: pd.DataFrame,
+    search_spec: Optional[dict] = None,
+    shared_embeddings: Optional[np.ndarray] = None
+) -> pd.DataFrame:
+    """
+    Search a single-row query against one shard.
+    """
+    return search_shard_batch(shard_label, query_df, [search_spec], shared_embeddings)[0]
+
+
+def _iter_on_pool(shard_labels: List[str], search_fn, max_workers: int) -> Iterator[Tuple[int, object]]:
+    """
+    Run `search_fn(shard_label)` for every shard on a bounded thread pool and yield
+    `(position in shard_labels, result)` pairs as each shard finishes.
+    """
+    def timed_search(shard_label):
+        start = time.time()
+        result = search_fn(shard_label)
+        return result, time.time() - start
+
+    workers = max(1, min(max_workers, len(shard_labels)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard-search") as executor:
+        futures = {
+            executor.submit(timed_search, shard_label): position
+            for position, shard_label in enumerate(shard_labels)
+        }
+        for future in as_completed(futures):
+            position = futures[future]
+            result, elapsed = future.result()
+            logging.info(f"Shard {shard_labels[position]} searched in {elapsed:.2f} seconds")
+            yield position, result
+
+
+def _run_on_pool(shard_labels: List[str], search_fn, max_workers: int) -> list:
+    """
+    Run `search_fn(shard_label)` for every shard on a bounded thread pool.
+
+    Results are collected as each shard finishes but returned in `shard_labels` order,
+    so the merged output does not depend on completion order.
+    """
+    results = [None] * len(shard_labels)
+    for position, result in _iter_on_pool(shard_labels, search_fn, max_workers):
+        results[position] = result
+    return results
+
+
+def iter_search_shards(
+    shard_labels: List[str],
+    query_df: pd.DataFrame,
+    search_spec: Optional[dict] = None,
+    max_workers: int = SHARD_SEARCH_WORKERS
+) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """
+    Fan a single query out over all shards on a bounded thread pool and yield
+    `(position in shard_labels, matches)` as each shard completes.
+
+    FAISS and the numpy/scipy transforms release the GIL, so shards are searched concurrently.
+    With shared preprocessors the query is embedded once up front instead of once per shard.
+    """
+    if not shard_labels:
+        return iter(())
+    embeddings = shared_query_embeddings(query_df)
+    return _iter_on_pool(shard_labels, lambda label: search_shard(label, query_df, search_spec, embeddings), max_workers)
+
+
+def search_shards_batch(
+    shard_plan: Dict[str, List[int]],
+    query_frames: List[pd.DataFrame],
+    search_specs: Optional[List[Optional[dict]]] = None,
+    max_workers: int = SHARD_SEARCH_WORKERS
+) -> List[List[pd.DataFrame]]:
+    """
+    Search many queries at once, embedding and searching each shard's queries in a single call.
+
+    Args:
+        shard_plan (Dict[str, List[int]]): Shard label -> positions of the queries that touch it
+        query_frames (List[pd.DataFrame]): One enriched single-row frame per query
+        search_specs (List[dict]): Optional search spec per query (see `shard_row_mask`)
+        max_workers (int): Upper bound on concurrent shard searches
+
+    Returns:
+        List[List[pd.DataFrame]]: Per query, its result frames in chronological shard order
+    """
+    per_query = [[] for _ in query_frames]
+    shard_labels = sorted(shard_plan)
+    if not shard_labels:
+        return per_query
+
+    # With shared preprocessors every query is embedded exactly once, whatever shards it touches
+    queried = sorted({pos for positions in shard_plan.values() for pos in positions})
+    shared_embeddings = shared_query_embeddings(pd.concat([query_frames[pos] for pos in queried], ignore_index=True))
+    row_of = {pos: row for row, pos in enumerate(queried)}
+
+    def search_fn(label):
+        positions = shard_plan[label]
+        batch_df = pd.concat([query_frames[pos] for pos in positions], ignore_index=True)
+        batch_specs = [search_specs[pos] for pos in positions] if search_specs else None
+        batch_embeddings = None
+        if shared_embeddings is not None:
+            batch_embeddings = shared_embeddings[[row_of[pos] for pos in positions]]
+        return search_shard_batch(label, batch_df, batch_specs, batch_embeddings)
+
+    shard_results = _run_on_pool(shard_labels, search_fn, max_workers)
+    for label, matches_per_row in zip(shard_labels, shard_results):
+        for pos, matches in zip(shard_plan[label], matches_per_row):
+            per_query[pos].append(matches)
+
+    return per_query
@@ -2,16 +2,146 @@ import pandas as pd
 import numpy as np
 from fuzzywuzzy import fuzz
 from app.base_similarity import string_similarity, safe_string_similarity
-from app.location_similarity import location_similarity_score, address_str_similarity_score, location_matching
-from app.age_similarity import age_similarity_score, dob_string_similarity
+from app.location_similarity import location_similarity_score, address_str_similarity_score, location_matching, location_similarity_scores, location_matching_column, address_similarity_scores
+from app.age_similarity import age_similarity_score, dob_string_similarity, age_similarity_scores, dob_string_similarity_columns
 from app.loc_access import LocDataAccess
+from app.name_scoring import ratio_scores
 import time
 import logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
-def compute_similarity_features(df, firstname, surname, dob, address, city_name, country, sex, nationality, iata_o, city_org, ctry_org, iata_d, city_dest, ctry_dest, lat_o, lon_o, lat_d, lon_d, max_distance=2500):
+EXPECTED_COLUMNS = [
+    'FNSimilarity', 'FN_rarity1', 'FN_rarity2', 'FN_prob1', 'FN_prob2',
+    'SNSimilarity', 'SN_rarity1', 'SN_rarity2', 'SN_prob1', 'SN_prob2',
+    'DOBSimilarity', 'DOB_rarity1', 'DOB_rarity2', 'DOB_prob1', 'DOB_prob2',
+    'AgeSimilarity', 'strAddressSimilarity', 'jcdAddressSimilarity', 'cityAddressMatch',
+    'countryAddressMatch', 'sexMatch', 'natMatch', 'originAirportMatch', 'destinationAirportMatch',
+    'originCityMatch', 'destinationCityMatch', 'originCountryMatch', 'destinationCountryMatch',
+    'orgdesAirportMatch', 'desorgAirportMatch', 'orgdesCityMatch', 'desorgCityMatch',
+    'orgdesCountryMatch', 'desorgCountryMatch', 'originSimilarity', 'originExpScore',
+    'destinationSimilarity', 'destinationExpScore', 'orgdesSimilarity', 'orgdesExpScore',
+    'desorgSimilarity', 'desorgExpScore'
+]
+
+
+# Features computed together, by the output columns they produce
+FEATURE_GROUPS = {
+    'names': ['FNSimilarity', 'FN_rarity1', 'FN_rarity2', 'FN_prob1', 'FN_prob2',
+              'SNSimilarity', 'SN_rarity1', 'SN_rarity2', 'SN_prob1', 'SN_prob2'],
+    'age': ['AgeSimilarity'],
+    'dob': ['DOBSimilarity', 'DOB1', 'DOB2', 'DOB_rarity1', 'DOB_rarity2', 'DOB_prob1', 'DOB_prob2'],
+    'address': ['strAddressSimilarity', 'jcdAddressSimilarity'],
+    'residence': ['cityAddressMatch', 'countryAddressMatch'],
+    'profile': ['sexMatch', 'natMatch'],
+    'airports': ['originAirportMatch', 'destinationAirportMatch', 'orgdesAirportMatch', 'desorgAirportMatch'],
+    'cities': ['originCityMatch', 'destinationCityMatch', 'orgdesCityMatch', 'desorgCityMatch'],
+    'countries': ['originCountryMatch', 'destinationCountryMatch', 'orgdesCountryMatch', 'desorgCountryMatch'],
+    'distances': ['originSimilarity', 'originExpScore', 'destinationSimilarity', 'destinationExpScore'],
+    'cross_distances': ['orgdesSimilarity', 'orgdesExpScore', 'desorgSimilarity', 'desorgExpScore'],
+}
+
+
+def compute_similarity_features(df, firstname, surname, dob, address, city_name, country, sex, nationality, iata_o, city_org, ctry_org, iata_d, city_dest, ctry_dest, lat_o, lon_o, lat_d, lon_d, max_distance=2500, features=None):
+    """
+    Computes similarity features and ensures expected columns exist.
+
+    Columnar engine: names are scored with one batched rapidfuzz call per column, equality
+    matches are vectorized string comparisons, distance scores are NumPy array math over the
+    candidate coordinates and missing values are handled with masks.
+    Produces the same columns as `compute_similarity_features_rowwise`.
+
+    `features` restricts the computation to some of the FEATURE_GROUPS (all by default); only
+    the expected columns of those groups are returned.
+    """
+    groups = FEATURE_GROUPS if features is None else {name: FEATURE_GROUPS[name] for name in features}
+    similarity_df = pd.DataFrame(index=df.index)
+
+    # Columns materialized at bundle build time are used as-is
+    if ('cities' in groups or 'countries' in groups) and 'OriginCity' not in df.columns:
+        add_airport_geo_columns(df)
+    if 'age' in groups or 'dob' in groups:
+        dob_dates = parsed_dobs(df)
+
+    if 'names' in groups:
+        similarity_df['FNSimilarity'] = name_scores(firstname, df, 'firstname')
+        similarity_df['SNSimilarity'] = name_scores(surname, df, 'surname')
+    if 'dob' in groups:
+        similarity_df[['DOBSimilarity', 'DOB1', 'DOB2', 'DOB_rarity1', 'DOB_rarity2', 'DOB_prob1', 'DOB_prob2']] = dob_string_similarity_columns(dob, df['dob'], parsed=dob_dates)
+    if 'age' in groups:
+        similarity_df['AgeSimilarity'] = age_similarity_scores(dob, dob_dates)
+    if 'address' in groups:
+        similarity_df['strAddressSimilarity'], similarity_df['jcdAddressSimilarity'] = address_similarity_scores(address, df['address'])
+    if 'residence' in groups:
+        similarity_df['cityAddressMatch'] = location_matching_column(city_name, df['city'])
+        similarity_df['countryAddressMatch'] = location_matching_column(country, df['country'])
+    if 'profile' in groups:
+        similarity_df['sexMatch'] = location_matching_column(sex, df['gender'])
+        similarity_df['natMatch'] = location_matching_column(nationality, df['nationality'])
+    if 'airports' in groups:
+        similarity_df['originAirportMatch'] = location_matching_column(iata_o, df['departure_airport'])
+        similarity_df['destinationAirportMatch'] = location_matching_column(iata_d, df['arrival_airport'])
+        similarity_df['orgdesAirportMatch'] = location_matching_column(iata_d, df['departure_airport'])
+        similarity_df['desorgAirportMatch'] = location_matching_column(iata_o, df['arrival_airport'])
+    if 'cities' in groups:
+        similarity_df['originCityMatch'] = location_matching_column(city_org, df['OriginCity'])
+        similarity_df['destinationCityMatch'] = location_matching_column(city_dest, df['DestinationCity'])
+        similarity_df['orgdesCityMatch'] = location_matching_column(city_dest, df['OriginCity'])
+        similarity_df['desorgCityMatch'] = location_matching_column(city_org, df['DestinationCity'])
+    if 'countries' in groups:
+        similarity_df['originCountryMatch'] = location_matching_column(ctry_org, df['OriginCountry'])
+        similarity_df['destinationCountryMatch'] = location_matching_column(ctry_dest, df['DestinationCountry'])
+        similarity_df['orgdesCountryMatch'] = location_matching_column(ctry_dest, df['OriginCountry'])
+        similarity_df['desorgCountryMatch'] = location_matching_column(ctry_org, df['DestinationCountry'])
+    if 'distances' in groups:
+        similarity_df['originSimilarity'], similarity_df['originExpScore'] = location_similarity_scores(lon_o, lat_o, df['dep_lon'], df['dep_lat'], max_distance)
+        similarity_df['destinationSimilarity'], similarity_df['destinationExpScore'] = location_similarity_scores(lon_d, lat_d, df['arr_lon'], df['arr_lat'], max_distance)
+    if 'cross_distances' in groups:
+        similarity_df['orgdesSimilarity'], similarity_df['orgdesExpScore'] = location_similarity_scores(lon_o, lat_o, df['arr_lon'], df['arr_lat'], max_distance)
+        # Same coordinate pairing as the row-wise implementation
+        similarity_df['desorgSimilarity'], similarity_df['desorgExpScore'] = location_similarity_scores(lon_d, lat_d, df['dep_lon'], df['arr_lat'], max_distance)
+
+    group_columns = {col for columns in groups.values() for col in columns}
+    for col in EXPECTED_COLUMNS:
+        if col in group_columns and col not in similarity_df.columns:
+            similarity_df[col] = 0
+
+    return similarity_df
+
+
+def name_scores(query, df, column):
+    """
+    `ratio_scores` against a name column, using its pre-lowercased `<column>_norm` twin when present.
+    """
+    if f'{column}_norm' in df.columns:
+        return ratio_scores(query.lower() if isinstance(query, str) else query, df[f'{column}_norm'], lowercase=False)
+    return ratio_scores(query, df[column])
+
+
+def parsed_dobs(df):
     """
-    Computes all similarity features and ensures expected columns exist.
+    Candidate dates of birth as datetime64, from the `dob_day` day number when present.
+    """
+    if 'dob_day' in df.columns:
+        return pd.to_datetime(df['dob_day'], unit='D')
+    return pd.to_datetime(df['dob'], errors='coerce')
+
+
+def add_airport_geo_columns(df):
+    """
+    Adds OriginCity/DestinationCity/OriginCountry/DestinationCountry with the bulk IATA resolvers.
+    """
+    loc_access = LocDataAccess.get_instance()
+    df['OriginCity'] = loc_access.cities_by_iata(df['departure_airport'])
+    df['DestinationCity'] = loc_access.cities_by_iata(df['arrival_airport'])
+    df['OriginCountry'] = loc_access.countries_by_iata(df['departure_airport'])
+    df['DestinationCountry'] = loc_access.countries_by_iata(df['arrival_airport'])
+    return df
+
+
+def compute_similarity_features_rowwise(df, firstname, surname, dob, address, city_name, country, sex, nationality, iata_o, city_org, ctry_org, iata_d, city_dest, ctry_dest, lat_o, lon_o, lat_d, lon_d, max_distance=2500):
+    """
+    Row-by-row reference implementation of `compute_similarity_features`.
+    Kept for parity checks and benchmarking against the columnar engine.
     """
     similarity_df = pd.DataFrame(index=df.index)
 
@@ -68,21 +198,8 @@ def compute_similarity_features(df, firstname, surname, dob, address, city_name,
     # similarity_df["candidate_arr_lat"] = df["arr_lat"]
 
 
-    expected_columns = [
-        'FNSimilarity', 'FN_rarity1', 'FN_rarity2', 'FN_prob1', 'FN_prob2',
-        'SNSimilarity', 'SN_rarity1', 'SN_rarity2', 'SN_prob1', 'SN_prob2',
-        'DOBSimilarity', 'DOB_rarity1', 'DOB_rarity2', 'DOB_prob1', 'DOB_prob2',
-        'AgeSimilarity', 'strAddressSimilarity', 'jcdAddressSimilarity', 'cityAddressMatch',
-        'countryAddressMatch', 'sexMatch', 'natMatch', 'originAirportMatch', 'destinationAirportMatch',
-        'originCityMatch', 'destinationCityMatch', 'originCountryMatch', 'destinationCountryMatch',
-        'orgdesAirportMatch', 'desorgAirportMatch', 'orgdesCityMatch', 'desorgCityMatch',
-        'orgdesCountryMatch', 'desorgCountryMatch', 'originSimilarity', 'originExpScore',
-        'destinationSimilarity', 'destinationExpScore', 'orgdesSimilarity', 'orgdesExpScore',
-        'desorgSimilarity', 'desorgExpScore'
-    ]
-
     # ✅ Fill missing columns with 0
-    for col in expected_columns:
+    for col in EXPECTED_COLUMNS:
         if col not in similarity_df.columns:
             similarity_df[col] = 0
 
@@ -5,6 +5,7 @@ const App = (() => {
     const API_ROUTES = {
         DELETE_TASK: '/delete_task',
         SIMILARITY_SEARCH: '/perform_similarity_search',
+        SIMILARITY_STREAM: '/combined_operation/stream',
         GET_RESULT: '/result',
         FLIGHT_IDS: '/flight_ids',
     };
@@ -58,6 +59,36 @@ const App = (() => {
         });
     };
     
+    // POSTs `data` and calls `onRecord` with each NDJSON record as it arrives; resolves when the stream ends
+    const streamRequest = async (url, data, onRecord) => {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': 'application/x-ndjson' },
+            body: JSON.stringify(data),
+        });
+        if (!response.ok) {
+            let message = response.statusText;
+            try {
+                message = (await response.json()).message || message;
+            } catch (error) {
+                // Non-JSON error body
+            }
+            throw { status: response.status, message: message, retryAfter: response.headers.get('Retry-After') };
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        for (;;) {
+            const { done, value } = await reader.read();
+            buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+            const lines = buffer.split('\n');
+            buffer = lines.pop(); // Keep the incomplete last line for the next chunk
+            lines.filter((line) => line.trim()).forEach((line) => onRecord(JSON.parse(line)));
+            if (done) break;
+        }
+        if (buffer.trim()) onRecord(JSON.parse(buffer));
+    };
 
     const showLoadingIndicator = () => {
         document.querySelector(SELECTORS.LOADING_INDICATOR).style.display = 'flex';
@@ -184,15 +215,18 @@ const App = (() => {
         event.preventDefault();
         showLoadingIndicator(); // Show loading indicator
 
-        const task_id = localStorage.getItem('task_id');
-        if (!task_id) {
-            showNotification('Task ID not found. Please start a task first.', 'warning');
+        const arrivalDateFrom = document.querySelector('#arrivalDateFrom').value;
+        const arrivalDateTo = document.querySelector('#arrivalDateTo').value;
+        if (!arrivalDateFrom || !arrivalDateTo) {
+            showNotification('Please set the arrival date range first.', 'warning');
             hideLoadingIndicator();
             return;
         }
     
         const data = {
-            task_id: task_id,
+            arrival_date_from: arrivalDateFrom,
+            arrival_date_to: arrivalDateTo,
+            flight_nbr: document.querySelector('#flightNbr').value || null,
             firstname: document.querySelector('#firstname').value || '',
             surname: document.querySelector('#surname').value || '',
             dob: document.querySelector('#dob').value || '',
@@ -221,17 +255,31 @@ const App = (() => {
         console.log('Payload being sent:', data);
 
     
-        sendRequest(API_ROUTES.SIMILARITY_SEARCH, data)
-            .then((response) => {
-                if (response && response.data) {
-                    displayResults(response);
-                } else {
+        // Shards are streamed as they finish; the table is re-rendered with each shard's matches
+        const rows = [];
+        const byScore = (a, b) => (b['Compound Similarity Score'] || 0) - (a['Compound Similarity Score'] || 0);
+        streamRequest(API_ROUTES.SIMILARITY_STREAM, data, (record) => {
+            if (record.record === 'shard') {
+                if (record.data && record.data.length > 0) {
+                    rows.push(...record.data);
+                    rows.sort(byScore);
+                    displayResults({ data: rows });
+                    hideLoadingIndicator(); // First matches are on screen
+                }
+            } else if (record.record === 'summary') {
+                console.log(`Search finished: ${record.matches} matches from ${record.shards} shards`);
+                if (record.matches === 0) {
                     showNotification('No similar passengers found.', 'info');
                 }
-            })
+            }
+        })
             .catch((err) => {
                 console.error('Error during similarity search:', err);
-                showNotification('Similarity search failed.', 'danger');
+                if (err.status === 429) {
+                    showNotification(`Search capacity exhausted, please retry in ${err.retryAfter} seconds.`, 'warning');
+                } else {
+                    showNotification('Similarity search failed.', 'danger');
+                }
             })
             .finally(hideLoadingIndicator);
     };
@@ -1,10 +1,111 @@
-from app.pipeline import run_similarity_pipeline
-from celery import Celery
+from datetime import datetime
+
+import orjson
+from celery import Celery, chord
+from celery.signals import celeryd_after_setup
+
+from app.pipeline import (
+    build_query,
+    build_search_spec,
+    expand_search_spec,
+    merge_shard_matches,
+    needs_expansion,
+    prepare_query_frame,
+    run_similarity_pipeline,
+    score_matches,
+    search_summary,
+    with_index_probes,
+)
+from app.serialization import decode_frame, dumps, encode_frame
+from app.shard_routing import owned_shard_queues, preload_shards, route_shard_task
+from app.faiss_search import index_probes
+from app.model_cache import load_model_bundle
+from app.shard_search import search_shard
+from app.utils import infer_shards_for_date_range
 
 app = Celery("similarity_app")
 app.config_from_object("app.config")  # optional, if you have config.py
+app.conf.task_track_started = True
+app.conf.result_expires = 3600  # 1 hour
+app.conf.task_routes = (route_shard_task,)
+
+
+@celeryd_after_setup.connect
+def consume_owned_shard_queues(sender, instance, **kwargs):
+    # In addition to the default queue (merge callbacks, whole-pipeline tasks)
+    for queue in owned_shard_queues():
+        instance.app.amqp.queues.select_add(queue)
+    # Runs in the main process before the pool starts: prefork children share these bundles
+    # copy-on-write, and solo and thread pools run tasks in this process
+    preload_shards()
 
 
 @app.task(name="process_similarity_task")
 def process_similarity_task(data: dict):
     return run_similarity_pipeline(data)
+
+
+def job_data(payload: dict) -> dict:
+    """
+    Request data from a JSON job payload (dates travel as ISO strings).
+    """
+    data = dict(payload)
+    for field in ("arrival_date_from", "arrival_date_to"):
+        if isinstance(data[field], str):
+            data[field] = datetime.fromisoformat(data[field])
+    return data
+
+
+def job_shards(payload: dict) -> list:
+    data = job_data(payload)
+    return infer_shards_for_date_range(data["arrival_date_from"], data["arrival_date_to"], data["shards"])
+
+
+def similarity_job(payload: dict, rounds: int = 0):
+    """
+    Celery signature of an asynchronous `/combined_operation`: a chord with one `search_shard_task`
+    per shard in the request's date range, so shards are searched in parallel across workers, and
+    `merge_and_score_task` as the callback. The job's result is the callback's.
+
+    Args:
+        payload (dict): JSON-serializable request data, including 'shards'
+        rounds (int): Expansion rounds already run (see `needs_expansion`)
+    """
+    header = [search_shard_task.s(payload, shard_label) for shard_label in job_shards(payload)]
+    return chord(header, merge_and_score_task.s(payload, rounds))
+
+
+@app.task(name="search_shard_task")
+def search_shard_task(payload: dict, shard_label: str) -> dict:
+    """
+    Search one shard for the job's query. Returns the matches as an encoded frame (see
+    `encode_frame`) and the shard index's (default nprobe, nlist), for the callback's expansion.
+    """
+    data = job_data(payload)
+    query_df = prepare_query_frame(build_query(data))
+    matches = search_shard(shard_label, query_df, build_search_spec(data))
+    return {"matches": encode_frame(matches), "probes": index_probes(load_model_bundle(shard_label)["index"])}
+
+
+@app.task(name="merge_and_score_task", bind=True)
+def merge_and_score_task(self, shard_results: list, payload: dict, rounds: int):
+    """
+    Chord callback: merge the per-shard matches (in shard order), score them, and when too few
+    survive for `min_results`, replace itself with a wider search round.
+    """
+    data = job_data(payload)
+    matches = merge_shard_matches(data, ((position, decode_frame(result["matches"])) for position, result in enumerate(shard_results)))
+    result = score_matches(data, build_query(data), matches, job_shards(payload))
+
+    probes = [shard_result["probes"] for shard_result in shard_results if shard_result["probes"] is not None]
+    search_spec = with_index_probes(
+        build_search_spec(data),
+        (max(nprobe for nprobe, _ in probes), max(nlist for _, nlist in probes)) if probes else None,
+    )
+    next_spec = expand_search_spec(search_spec) if needs_expansion(data, result, rounds) else None
+    if next_spec is not None:
+        raise self.replace(similarity_job(dict(payload, top_k=next_spec["top_k"], nprobe=next_spec["nprobe"]), rounds + 1))
+
+    result["search"] = search_summary(search_spec, rounds)
+    # Timestamps and NumPy scalars become plain JSON values for the result backend
+    return orjson.loads(dumps(result))
@@ -5,17 +5,26 @@ from glob import glob
 import joblib
 from multiprocessing import Pool, cpu_count
 import faiss
+import numpy as np
 
 from parser import parse_large_pnr_xml, compute_relative_age
-from embedding_train import embed_passengers_train
-from data_and_index_split import split_and_index_metadata
+from embedding_train import PREPROCESSOR_NAMES, embed_passengers_train, embed_shard, fit_global_preprocessors, save_preprocessors
+from query_embedder import compile_query_embedder
+from shard_bundle import convert_legacy_shard
 
 from loc_access import LocDataAccess
 from config import (
     PREPROCESSOR_DIR,
+    SHARED_EMBEDDING,
+    SHARED_EMBEDDING_LABEL,
+    SHARED_EMBEDDING_SAMPLE,
+    STRUCTURED_FILTER_COLUMNS,
     XML_FOLDER,
 )
 
+# IVF lists probed by default in indexes built here (queries can ask for more with `nprobe`)
+SHARD_NPROBE = 10
+
 def parse_wrapper(xml_path):
     try:
         last_modified = os.path.getmtime(xml_path)
@@ -43,18 +52,68 @@ def parse_all_xml(folder, chunk_size=5000):
 def enrich_location(df):
     loc_access = LocDataAccess.get_instance()
 
-    # Map IATA to lon/lat tuples
-    df["dep_lon"], df["dep_lat"] = zip(*df["departure_airport"].map(loc_access.get_airport_lon_lat_by_iata))
-    df["arr_lon"], df["arr_lat"] = zip(*df["arrival_airport"].map(loc_access.get_airport_lon_lat_by_iata))
+    # Resolve IATA codes to lon/lat arrays
+    dep_lon, dep_lat = loc_access.lon_lat_by_iata(df["departure_airport"])
+    arr_lon, arr_lat = loc_access.lon_lat_by_iata(df["arrival_airport"])
 
     # Replace missing values with 0.0
-    df["dep_lon"] = pd.to_numeric(df["dep_lon"], errors="coerce").fillna(0.0)
-    df["dep_lat"] = pd.to_numeric(df["dep_lat"], errors="coerce").fillna(0.0)
-    df["arr_lon"] = pd.to_numeric(df["arr_lon"], errors="coerce").fillna(0.0)
-    df["arr_lat"] = pd.to_numeric(df["arr_lat"], errors="coerce").fillna(0.0)
+    df["dep_lon"] = pd.Series(dep_lon, index=df.index).fillna(0.0)
+    df["dep_lat"] = pd.Series(dep_lat, index=df.index).fillna(0.0)
+    df["arr_lon"] = pd.Series(arr_lon, index=df.index).fillna(0.0)
+    df["arr_lat"] = pd.Series(arr_lat, index=df.index).fillna(0.0)
 
     return df
 
+def shard_windows(start_date, end_date, time_window_months):
+    """
+    Consecutive windows of `time_window_months` months as (label, start, end), end exclusive; labels
+    name the first and last day, e.g. "2019-01-01_2019-02-28".
+    """
+    windows = []
+    start, stop = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    while start < stop:
+        end = min(start + pd.DateOffset(months=time_window_months), stop)
+        windows.append((f"{start:%Y-%m-%d}_{end - pd.Timedelta(days=1):%Y-%m-%d}", start, end))
+        start = end
+    return windows
+
+
+def build_ivf_index(embeddings):
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    # About sqrt(n) lists, with the 39 training points per centroid FAISS asks for
+    nlist = max(1, min(int(np.sqrt(len(embeddings))), len(embeddings) // 39))
+    quantizer = faiss.IndexFlatL2(embeddings.shape[1])
+    index = faiss.IndexIVFFlat(quantizer, embeddings.shape[1], nlist)
+    index.train(embeddings)
+    index.add(embeddings)
+    index.nprobe = min(nlist, SHARD_NPROBE)
+    return index
+
+
+def index_shards_shared(df, preprocessors, out_dir, start_date, end_date, time_window_months):
+    """
+    Split passengers into time-window shards by departure time and index each shard with the
+    shared preprocessors. Only the FAISS index and metadata are written per shard (and stale
+    per-shard preprocessors removed), so the API serves every shard with the shared bundle.
+    """
+    departures = pd.to_datetime(df["departure_time"], errors="coerce")
+    labels = []
+    for label, start, end in shard_windows(start_date, end_date, time_window_months):
+        shard_df = df[(departures >= start) & (departures < end)].reset_index(drop=True)
+        if shard_df.empty:
+            continue
+        # embed_passengers_train normalizes text columns in place
+        embeddings, _ = embed_shard(shard_df.copy(), preprocessors)
+        faiss.write_index(build_ivf_index(embeddings), os.path.join(out_dir, f"faiss_IVF_{label}.index"))
+        shard_df.to_parquet(os.path.join(out_dir, f"metadata_{label}.parquet"), index=False)
+        for name in PREPROCESSOR_NAMES + ["embedder"]:
+            stale = os.path.join(out_dir, f"{name}_{label}.pkl")
+            if os.path.exists(stale):
+                os.remove(stale)
+        print(f"Indexed shard {label}: {len(shard_df)} passengers")
+        labels.append(label)
+    return labels
+
 
 if __name__ == "__main__":
     start = time.time()
@@ -72,19 +131,42 @@ if __name__ == "__main__":
     df = enrich_location(df)
     # df.to_parquet(os.path.join(PREPROCESSOR_DIR, f"metadata_{label}.parquet"), index=False)
 
-
-    labels = split_and_index_metadata(
-        df,
-        PREPROCESSOR_DIR,
-        PREPROCESSOR_DIR,
-        PREPROCESSOR_DIR,
-        start_date="2019-01-01",
-        end_date="2020-01-01",
-        time_window_months=2
-        )
+    if SHARED_EMBEDDING:
+        # One preprocessing bundle for all shards, so the API embeds each query once
+        # and FAISS distances are comparable across shards
+        preprocessors = fit_global_preprocessors(df, SHARED_EMBEDDING_SAMPLE)
+        save_preprocessors(preprocessors, PREPROCESSOR_DIR, SHARED_EMBEDDING_LABEL)
+        print(f"Saved shared preprocessors as '{SHARED_EMBEDDING_LABEL}'")
+        labels = index_shards_shared(
+            df,
+            preprocessors,
+            PREPROCESSOR_DIR,
+            start_date="2019-01-01",
+            end_date="2020-01-01",
+            time_window_months=2
+            )
+    else:
+        from data_and_index_split import split_and_index_metadata
+
+        labels = split_and_index_metadata(
+            df,
+            PREPROCESSOR_DIR,
+            PREPROCESSOR_DIR,
+            PREPROCESSOR_DIR,
+            start_date="2019-01-01",
+            end_date="2020-01-01",
+            time_window_months=2
+            )
     print(f"Created {len(labels)} shards: {labels}")
     print(f"labels: {labels}")
 
+    # Consolidated, memory-mappable bundle per shard (model/shard_<label>/), which the API loads in preference
+    for label in labels + ([SHARED_EMBEDDING_LABEL] if SHARED_EMBEDDING else []):
+        manifest = convert_legacy_shard(
+            PREPROCESSOR_DIR, label, STRUCTURED_FILTER_COLUMNS, compile_query_embedder, LocDataAccess.get_instance()
+        )
+        print(f"Bundled shard {label} (checksum {manifest['checksum'][:12]})")
+
 
     # Step 2: Feature enrichment
     
@@ -1,6 +1,7 @@
 from dateutil.relativedelta import relativedelta
 from datetime import datetime
 from typing import List
+import numpy as np
 import pandas as pd
 
 from app.loc_access import LocDataAccess
@@ -72,6 +73,29 @@ def infer_shards_for_date_range(start_date_str: str, end_date_str: str, shard_la
     except Exception as e:
         raise ValueError(f"Invalid date range input: {start_date_str} to {end_date_str}") from e
     
+def adjacent_shards(shard_labels: List[str], all_shard_labels: List[str]) -> List[str]:
+    """
+    Shards immediately after and before a contiguous run of shards, in that order.
+
+    Used to prefetch the windows a sliding-window analyst is likely to query next.
+
+    Args:
+        shard_labels (List[str]): Shards touched by the current query (from infer_shards_for_date_range)
+        all_shard_labels (List[str]): All registered shard labels in chronological order
+
+    Returns:
+        List[str]: The next and previous shard labels that exist
+    """
+    positions = [all_shard_labels.index(label) for label in shard_labels if label in all_shard_labels]
+    if not positions:
+        return []
+    neighbours = []
+    if max(positions) + 1 < len(all_shard_labels):
+        neighbours.append(all_shard_labels[max(positions) + 1])
+    if min(positions) - 1 >= 0:
+        neighbours.append(all_shard_labels[min(positions) - 1])
+    return neighbours
+
 
 def compute_relative_age(df):
     today = pd.Timestamp("today")
@@ -82,12 +106,11 @@ def compute_relative_age(df):
 
 def enrich_location(df):
     loc_access = LocDataAccess.get_instance()
-    df["dep_lon"], df["dep_lat"] = zip(*df["iata_o"].map(loc_access.get_airport_lon_lat_by_iata))
-    df["arr_lon"], df["arr_lat"] = zip(*df["iata_d"].map(loc_access.get_airport_lon_lat_by_iata))
+    dep_lon, dep_lat = loc_access.lon_lat_by_iata(df["iata_o"])
+    arr_lon, arr_lat = loc_access.lon_lat_by_iata(df["iata_d"])
 
-    df["dep_lon"] = df["dep_lon"].fillna(0.0).infer_objects(copy=False)
-    df["dep_lat"] = df["dep_lat"].fillna(0.0).infer_objects(copy=False)
-    df["arr_lon"] = df["arr_lon"].fillna(0.0).infer_objects(copy=False)
-    df["arr_lat"] = df["arr_lat"].fillna(0.0).infer_objects(copy=False)
+    df["dep_lon"] = np.nan_to_num(dep_lon, nan=0.0)
+    df["dep_lat"] = np.nan_to_num(dep_lat, nan=0.0)
+    df["arr_lon"] = np.nan_to_num(arr_lon, nan=0.0)
+    df["arr_lat"] = np.nan_to_num(arr_lat, nan=0.0)
     return df
-
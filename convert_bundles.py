@@ -0,0 +1,50 @@
+"""
+Convert shards from the legacy layout (joblib pickles, `faiss_IVF_<label>.index`,
+`metadata_<label>.parquet`) to consolidated, memory-mappable bundle directories
+(`model/shard_<label>/`, see app/shard_bundle.py).
+
+The API loads a shard from its bundle directory when one exists, so converting is enough to switch
+it over; the legacy files can be removed afterwards. The shared ('global') preprocessors are
+converted too when present.
+
+Usage (from the repository root):
+    python convert_bundles.py [--labels 2019-01-01_2019-02-28 ...] [--verify]
+"""
+import argparse
+import glob
+import os
+import time
+
+from app.config import PREPROCESSOR_DIR, SHARED_EMBEDDING_LABEL, STRUCTURED_FILTER_COLUMNS
+from app.loc_access import LocDataAccess
+from app.query_embedder import compile_query_embedder
+from app.shard_bundle import bundle_dir, convert_legacy_shard, verify_bundle
+
+
+def legacy_labels(model_dir):
+    labels = [
+        os.path.basename(path)[len("faiss_IVF_"):-len(".index")]
+        for path in glob.glob(os.path.join(model_dir, "faiss_IVF_*.index"))
+    ]
+    if os.path.exists(os.path.join(model_dir, f"encoder_{SHARED_EMBEDDING_LABEL}.pkl")):
+        labels.append(SHARED_EMBEDDING_LABEL)
+    return sorted(labels)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=PREPROCESSOR_DIR)
+    parser.add_argument("--labels", nargs="+", default=None)
+    parser.add_argument("--verify", action="store_true", help="re-hash every written file against its manifest")
+    args = parser.parse_args()
+
+    for label in args.labels or legacy_labels(args.model_dir):
+        start = time.time()
+        manifest = convert_legacy_shard(
+            args.model_dir, label, STRUCTURED_FILTER_COLUMNS, compile_query_embedder, LocDataAccess.get_instance()
+        )
+        if args.verify:
+            verify_bundle(bundle_dir(args.model_dir, label))
+        size = sum(f["bytes"] for f in manifest["files"].values())
+        print(f"{label}: {len(manifest['files'])} files, {size / 2**20:.1f} MiB, "
+              f"checksum {manifest['checksum'][:12]} ({time.time() - start:.2f} s)")
@@ -0,0 +1,89 @@
+"""
+Timing for the precompiled query embedder.
+
+Loads a trained shard's preprocessors from `model/` and times `embed_compiled` against the sklearn
+`embed_passengers` path on the shard's own passengers (plus a few edge-case rows), for single-row
+queries and for a batch. Their equivalence is checked without trained shards in test_query_embedder.py.
+
+Usage (from the repository root):
+    python embedder_benchmark.py [--shard 2019-01-01_2019-02-28] [--rows 2000] [--repeats 200]
+"""
+import argparse
+import glob
+import logging
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from app.embedding import embed_passengers
+from app.model_cache import PREPROCESSOR_NAMES, bundle_paths
+from app.query_embedder import compile_query_embedder, embed_compiled
+
+logging.disable(logging.INFO)
+
+EDGE_CASES = [
+    {"firstname": None, "surname": "", "address": None, "gender": None, "nationality": None},
+    {"firstname": "  Jean-Luc ", "surname": "O'Neil", "address": "  12   High-St.  London ", "gender": "X"},
+    {"firstname": "Zoë", "surname": "Ærø", "address": "Straße 5", "nationality": "ZZZ", "relative_age": np.nan},
+]
+
+
+def default_shard():
+    encoders = sorted(glob.glob("model/encoder_*.pkl"))
+    if not encoders:
+        raise SystemExit("No trained shards found in model/")
+    return os.path.basename(encoders[0])[len("encoder_"):-len(".pkl")]
+
+
+def load_preprocessors(shard_label):
+    paths = bundle_paths(shard_label)
+    return {name: joblib.load(paths[name]) for name in PREPROCESSOR_NAMES}
+
+
+def sklearn_embed(df, preprocessors):
+    embeddings, *_ = embed_passengers(df.copy(), *(preprocessors[name] for name in PREPROCESSOR_NAMES))
+    return embeddings
+
+
+def make_queries(shard_label, rows):
+    # The shared ('global') bundle has no metadata of its own; any shard's passengers will do
+    path = bundle_paths(shard_label)["metadata"]
+    if not os.path.exists(path):
+        path = sorted(glob.glob("model/metadata_*.parquet"))[0]
+    metadata = pd.read_parquet(path)
+    queries = metadata.head(rows).reset_index(drop=True)
+    edge_rows = pd.DataFrame([{**queries.iloc[0].to_dict(), **case} for case in EDGE_CASES])
+    return pd.concat([queries, edge_rows], ignore_index=True)
+
+
+def time_call(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def benchmark(queries, preprocessors, embedder, repeats):
+    print(f"{'rows':>6} {'sklearn (ms)':>13} {'compiled (ms)':>14} {'speed-up':>9}")
+    for batch in (queries.head(1), queries):
+        runs = repeats if len(batch) == 1 else max(1, repeats // 20)
+        slow = time_call(lambda: sklearn_embed(batch, preprocessors), runs) * 1e3
+        fast = time_call(lambda: embed_compiled(batch, embedder), runs) * 1e3
+        print(f"{len(batch):>6} {slow:>13.3f} {fast:>14.3f} {slow / fast:>8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shard", default=None)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    shard_label = args.shard or default_shard()
+    preprocessors = load_preprocessors(shard_label)
+    embedder = compile_query_embedder(preprocessors)
+    queries = make_queries(shard_label, args.rows)
+    benchmark(queries, preprocessors, embedder, args.repeats)
@@ -0,0 +1,154 @@
+"""
+Scaling benchmark for the similarity feature engine.
+
+Builds synthetic candidate frames and times the columnar `compute_similarity_features` against the
+row-wise reference implementation for growing candidate counts, the cheap-first threshold cascade of
+`score_matches` against computing every feature before filtering, and the batched rapidfuzz name
+kernel against per-pair fuzzywuzzy scoring. Their equivalence is checked in test_similarity_features.py.
+
+Usage (from the repository root):
+    python feature_benchmark.py [--sizes 100 1000 10000]
+"""
+import argparse
+import logging
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from app.loc_access import LocDataAccess
+from app.name_scoring import ratio_scores
+from app.pipeline import DEFERRED_FEATURES, THRESHOLD_FEATURES, threshold_mask
+from app.similarity_metrics import compute_similarity_features, compute_similarity_features_rowwise, compute_string_similarity
+
+warnings.filterwarnings("ignore", category=FutureWarning)
+logging.disable(logging.INFO)
+
+FIRSTNAMES = ["John", "Jon", "Johan", "Mary", "Maria", "Ahmed", "Ali", "Li", "Wei", "Anna", None]
+SURNAMES = ["Smith", "Smyth", "Brown", "Khan", "Wang", "Garcia", "Muller", "Mueller", "Lee", ""]
+AIRPORTS = ["LHR", "CDG", "ALG", "JNB", "CPT", "RBA", "JFK", "DXB", "ZZZ"]
+ADDRESSES = ["12 High Street London", "12 high st  london", "5 Rue de Rivoli Paris", "", None, "1 Main Road Cape Town"]
+
+QUERY = {
+    "firstname": "John",
+    "surname": "Smith",
+    "dob": "1980-05-05",
+    "address": "12 High Street London",
+    "city_name": "London",
+    "sex": "M",
+    "nationality": "GBR",
+    "iata_o": "LHR",
+    "iata_d": "CDG",
+}
+
+
+def make_candidates(n, seed=42):
+    rng = np.random.default_rng(seed)
+    loc_access = LocDataAccess.get_instance()
+    df = pd.DataFrame({
+        "firstname": rng.choice(np.array(FIRSTNAMES, dtype=object), n),
+        "surname": rng.choice(np.array(SURNAMES, dtype=object), n),
+        "dob": pd.to_datetime("1940-01-01") + pd.to_timedelta(rng.integers(0, 25000, n), unit="D"),
+        "address": rng.choice(np.array(ADDRESSES, dtype=object), n),
+        "city": rng.choice(np.array(["London", "Paris", "Cape Town", None], dtype=object), n),
+        "country": rng.choice(np.array(["GBR", "FRA", "ZAF", None], dtype=object), n),
+        "gender": rng.choice(np.array(["M", "F", None], dtype=object), n),
+        "nationality": rng.choice(np.array(["GBR", "FRA", "DZA", None], dtype=object), n),
+        "departure_airport": rng.choice(AIRPORTS, n),
+        "arrival_airport": rng.choice(AIRPORTS, n),
+    })
+    df.loc[rng.random(n) < 0.05, "dob"] = pd.NaT
+    for prefix, column in (("dep", "departure_airport"), ("arr", "arrival_airport")):
+        lon, lat = loc_access.lon_lat_by_iata(df[column])
+        df[f"{prefix}_lon"] = np.nan_to_num(lon, nan=0.0)
+        df[f"{prefix}_lat"] = np.nan_to_num(lat, nan=0.0)
+    return df
+
+
+def query_kwargs(query):
+    loc_access = LocDataAccess.get_instance()
+    lon_o, lat_o = loc_access.get_airport_lon_lat_by_iata(query["iata_o"])
+    lon_d, lat_d = loc_access.get_airport_lon_lat_by_iata(query["iata_d"])
+    return dict(
+        firstname=query["firstname"],
+        surname=query["surname"],
+        dob=query["dob"],
+        address=query["address"],
+        city_name=query["city_name"],
+        country=loc_access.get_country_by_city(query["city_name"]),
+        sex=query["sex"],
+        nationality=query["nationality"],
+        iata_o=query["iata_o"],
+        city_org=loc_access.get_city_by_airport_iata(query["iata_o"]),
+        ctry_org=loc_access.get_country_by_airport_iata(query["iata_o"]),
+        iata_d=query["iata_d"],
+        city_dest=loc_access.get_city_by_airport_iata(query["iata_d"]),
+        ctry_dest=loc_access.get_country_by_airport_iata(query["iata_d"]),
+        lon_o=lon_o,
+        lat_o=lat_o,
+        lon_d=lon_d,
+        lat_d=lat_d,
+    )
+
+
+def full_then_filter(candidates, kwargs, thresholds):
+    features = compute_similarity_features(candidates, **kwargs)
+    return pd.concat([candidates, features], axis=1)[threshold_mask(thresholds, features)]
+
+
+def cascade(candidates, kwargs, thresholds):
+    threshold_features = compute_similarity_features(candidates, features=THRESHOLD_FEATURES, **kwargs)
+    passed = threshold_mask(thresholds, threshold_features)
+    survivors = candidates[passed].copy()
+    deferred = compute_similarity_features(survivors, features=DEFERRED_FEATURES, **kwargs)
+    return pd.concat([survivors, threshold_features[passed], deferred], axis=1)
+
+
+def benchmark_cascade(candidates, kwargs, thresholds):
+    start = time.perf_counter()
+    passed = len(full_then_filter(candidates.copy(), kwargs, thresholds))
+    full = time.perf_counter() - start
+    start = time.perf_counter()
+    cascade(candidates.copy(), kwargs, thresholds)
+    staged = time.perf_counter() - start
+    print(f"Cascade on {len(candidates)} candidates, {passed} pass {thresholds}: "
+          f"{full:.3f}s -> {staged:.3f}s")
+
+
+def benchmark(sizes, kwargs):
+    print(f"{'candidates':>10} {'row-wise (s)':>14} {'columnar (s)':>14} {'speed-up':>9}")
+    for n in sizes:
+        candidates = make_candidates(n)
+        start = time.perf_counter()
+        compute_similarity_features_rowwise(candidates.copy(), **kwargs)
+        rowwise = time.perf_counter() - start
+        start = time.perf_counter()
+        compute_similarity_features(candidates.copy(), **kwargs)
+        columnar = time.perf_counter() - start
+        print(f"{n:>10} {rowwise:>14.3f} {columnar:>14.3f} {rowwise / columnar:>8.1f}x")
+
+
+def benchmark_name_scoring(sizes, query=QUERY["surname"]):
+    print(f"{'names':>10} {'per-pair (s)':>14} {'batched (s)':>14} {'speed-up':>9}")
+    for n in sizes:
+        names = make_candidates(n)["surname"]
+        start = time.perf_counter()
+        names.map(lambda x: compute_string_similarity(query, x))
+        per_pair = time.perf_counter() - start
+        start = time.perf_counter()
+        ratio_scores(query, names)
+        batched = time.perf_counter() - start
+        print(f"{n:>10} {per_pair:>14.3f} {batched:>14.3f} {per_pair / batched:>8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    kwargs = query_kwargs(QUERY)
+    benchmark_cascade(make_candidates(10000, seed=7), kwargs, {"nameThreshold": 30, "ageThreshold": 20, "dob": QUERY["dob"]})
+    benchmark_cascade(make_candidates(10000, seed=7), kwargs, {"nameThreshold": 80, "ageThreshold": 50, "dob": QUERY["dob"]})
+    benchmark(args.sizes, kwargs)
+    benchmark_name_scoring([n * 10 for n in args.sizes])
@@ -0,0 +1,81 @@
+"""
+Equivalence check for the precompiled query embedder.
+
+Fits the preprocessors on a small synthetic passenger frame, as training does, and checks that
+`embed_compiled` reproduces the sklearn `embed_passengers` path on unseen passengers and on the
+edge-case rows of embedder_benchmark.py, batched and one row at a time. Needs no trained shards.
+
+Usage (from the repository root):
+    python -m pytest test_query_embedder.py
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.config import CATEGORICAL_FEATURES, NUMERIC_FEATURES, TEXT_FEATURES
+from app.model_cache import PREPROCESSOR_NAMES
+from app.query_embedder import compile_query_embedder, embed_compiled
+from embedder_benchmark import EDGE_CASES, sklearn_embed
+
+# The training modules import their siblings top-level, as when run from app/ (see train_during_compose.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from embedding_train import embed_passengers_train  # noqa: E402
+
+SYLLABLES = ["an", "be", "ka", "li", "mo", "ra", "sa", "to", "vi", "ze", "ou", "ch", "el", "is", "ng"]
+STREETS = ["High Street", "Rue de Rivoli", "Main Road", "Calle Mayor", "Hauptstrasse", "Station Rd."]
+CITIES = ["London", "Paris", "Cape Town", "Madrid", "Berlin", "Algiers"]
+
+
+def make_passengers(n, seed):
+    rng = np.random.default_rng(seed)
+
+    def words(count):
+        return ["".join(rng.choice(SYLLABLES, rng.integers(2, 5))).title() for _ in range(count)]
+
+    df = pd.DataFrame({
+        "firstname": words(n),
+        "surname": words(n),
+        "address": [f"{number} {street} {city}" for number, street, city in zip(
+            rng.integers(1, 200, n), rng.choice(STREETS, n), rng.choice(CITIES, n)
+        )],
+        "city": rng.choice(CITIES, n),
+        "gender": rng.choice(np.array(["M", "F", None], dtype=object), n),
+        "nationality": rng.choice(np.array(["GBR", "FRA", "ZAF", "ESP", "DEU", "DZA", None], dtype=object), n),
+        "relative_age": rng.uniform(0, 90, n),
+        "dep_lat": rng.uniform(-60, 60, n),
+        "dep_lon": rng.uniform(-180, 180, n),
+        "arr_lat": rng.uniform(-60, 60, n),
+        "arr_lon": rng.uniform(-180, 180, n),
+    })
+    df.loc[rng.random(n) < 0.05, "relative_age"] = np.nan
+    return df[NUMERIC_FEATURES + CATEGORICAL_FEATURES + TEXT_FEATURES]
+
+
+@pytest.fixture(scope="module")
+def preprocessors():
+    _, *fitted = embed_passengers_train(make_passengers(400, seed=1), fit=True)
+    return dict(zip(PREPROCESSOR_NAMES, fitted))
+
+
+@pytest.fixture(scope="module")
+def queries():
+    passengers = make_passengers(200, seed=2)
+    edge_rows = pd.DataFrame([{**passengers.iloc[0].to_dict(), **case} for case in EDGE_CASES])
+    return pd.concat([passengers, edge_rows], ignore_index=True)
+
+
+def test_compiled_batch_matches_sklearn(preprocessors, queries):
+    expected = sklearn_embed(queries, preprocessors)
+    actual = embed_compiled(queries, compile_query_embedder(preprocessors))
+    assert expected.shape == actual.shape
+    assert np.allclose(actual, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_compiled_single_rows_match_sklearn(preprocessors, queries):
+    embedder = compile_query_embedder(preprocessors)
+    for row in [0, 1, *range(len(queries) - len(EDGE_CASES), len(queries))]:
+        query = queries.iloc[[row]].reset_index(drop=True)
+        assert np.allclose(embed_compiled(query, embedder), sklearn_embed(query, preprocessors), rtol=1e-5, atol=1e-6), row
@@ -0,0 +1,72 @@
+"""
+Equivalence checks for the similarity feature engine.
+
+The columnar `compute_similarity_features` must match the row-wise reference implementation,
+the cheap-first threshold cascade must keep the same candidates and feature values as scoring every
+feature before filtering, and the batched rapidfuzz name kernel must match per-pair fuzzywuzzy scores.
+
+Usage (from the repository root):
+    python -m pytest test_similarity_features.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.name_scoring import ratio_scores
+from app.similarity_metrics import compute_similarity_features, compute_similarity_features_rowwise, compute_string_similarity
+from feature_benchmark import QUERY, cascade, full_then_filter, make_candidates, query_kwargs
+
+
+def edge_candidates():
+    """Candidates with missing, empty and unknown values next to an exact match of the query."""
+    df = make_candidates(5, seed=1)
+    for col in ["firstname", "surname", "address", "city", "country", "gender", "nationality"]:
+        df.loc[0, col] = None
+        df.loc[1, col] = ""
+    df.loc[0, "dob"] = pd.NaT
+    df.loc[2, ["firstname", "surname", "address", "city", "gender", "nationality"]] = [
+        QUERY["firstname"], QUERY["surname"], QUERY["address"], QUERY["city_name"], QUERY["sex"], QUERY["nationality"]
+    ]
+    df.loc[2, "dob"] = pd.Timestamp(QUERY["dob"])
+    df.loc[3, "address"] = "  12 HIGH street   LONDON "
+    df.loc[4, ["departure_airport", "arrival_airport"]] = "ZZZ"
+    df.loc[4, ["dep_lon", "dep_lat", "arr_lon", "arr_lat"]] = 0.0
+    return df
+
+
+@pytest.fixture(scope="module")
+def kwargs():
+    return query_kwargs(QUERY)
+
+
+def test_columnar_matches_rowwise(kwargs):
+    candidates = pd.concat([make_candidates(2000, seed=7), edge_candidates()], ignore_index=True)
+    expected = compute_similarity_features_rowwise(candidates.copy(), **kwargs)
+    actual = compute_similarity_features(candidates.copy(), **kwargs)
+    assert list(expected.columns) == list(actual.columns)
+    for col in expected.columns:
+        numeric_expected = pd.to_numeric(expected[col], errors="coerce")
+        if numeric_expected.notna().any() or expected[col].isna().all():
+            np.testing.assert_allclose(
+                numeric_expected.astype(float), pd.to_numeric(actual[col], errors="coerce").astype(float),
+                rtol=0, atol=1e-9, err_msg=col
+            )
+        else:
+            same = (expected[col] == actual[col]) | (expected[col].isna() & actual[col].isna())
+            assert same.all(), col
+
+
+@pytest.mark.parametrize("name_threshold, age_threshold", [(30, 20), (80, 50)])
+def test_cascade_matches_full_scoring(kwargs, name_threshold, age_threshold):
+    candidates = pd.concat([make_candidates(10000, seed=7), edge_candidates()], ignore_index=True)
+    thresholds = {"nameThreshold": name_threshold, "ageThreshold": age_threshold, "dob": QUERY["dob"]}
+    expected = full_then_filter(candidates.copy(), kwargs, thresholds)
+    actual = cascade(candidates.copy(), kwargs, thresholds)[expected.columns]
+    pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+
+
+def test_batched_name_scores_match_fuzz_ratio():
+    names = pd.concat([make_candidates(1000)["surname"], edge_candidates()["surname"]], ignore_index=True)
+    expected = names.map(lambda x: compute_string_similarity(QUERY["surname"], x))
+    actual = ratio_scores(QUERY["surname"], names)
+    assert (expected.to_numpy() == actual.to_numpy()).all()